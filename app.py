@@ -1,48 +1,61 @@
 # app.py 雲端穩定 + 一鍵報表版
 import streamlit as st
-import pandas as pd
 import time
 import os
-import re
-import ast 
 import subprocess
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # ========== 1. 雲端環境自動修復 (保留原始補丁) ==========
+# Streamlit 每次互動都會重跑整支腳本，環境偵測結果以 cache_resource 保存於行程內，只執行一次
+@st.cache_resource(show_spinner=False)
 def ensure_anystyle_installed():
+    gem_bin = subprocess.getoutput("ruby -e 'print Gem.user_dir'") + "/bin"
     possible_paths = [
         "/home/appuser/.local/share/gem/ruby/3.1.0/bin",
         "/home/adminuser/.local/share/gem/ruby/3.1.0/bin",
-        subprocess.getoutput("ruby -e 'print Gem.user_dir'") + "/bin"
+        gem_bin
     ]
     for p in possible_paths:
         if p not in os.environ["PATH"]:
             os.environ["PATH"] = p + os.pathsep + os.environ["PATH"]
 
-    try:
-        subprocess.run(["anystyle", "--version"], capture_output=True, check=True)
-    except:
-        with st.spinner("☁️ 正在初始化雲端 AnyStyle 環境..."):
-            os.system("gem install anystyle-cli --user-install")
-            new_path = subprocess.getoutput("ruby -e 'print Gem.user_dir'") + "/bin"
-            if new_path not in os.environ["PATH"]:
-                os.environ["PATH"] = new_path + os.pathsep + os.environ["PATH"]
+    # 獨立偵測 (不依賴 modules.parsers)，模組載入失敗時仍保留原本的錯誤提示
+    for cmd in (["anystyle", "--version"], ["ruby", "-S", "anystyle", "--version"]):
+        try:
+            subprocess.run(cmd, capture_output=True, check=True)
+            return True
+        except:
+            continue
+    with st.spinner("☁️ 正在初始化雲端 AnyStyle 環境..."):
+        os.system("gem install anystyle-cli --user-install")
+    # parsers.find_anystyle_command 找不到指令時會清除快取重新偵測，安裝後不需另外處理
+    return False
 
 ensure_anystyle_installed()
 
-# ========== 2. 導入模組 (保留原始 Try-Except) ==========
+# ========== 2. 導入模組 (保留原始 Try-Except；重量級依賴延遲至首次使用才載入) ==========
 try:
     from modules.parsers import parse_references_with_anystyle
-    from modules.local_db import load_csv_data, search_local_database
-    from modules.api_clients import (
-        get_scopus_key, get_serpapi_key, search_crossref_by_doi,
-        search_crossref_by_text, search_scopus_by_title,
-        search_scholar_by_title, search_scholar_by_ref_text,
-        search_s2_by_title, search_openalex_by_title, check_url_availability
-    )
 except Exception as e:
     st.error(f"❌ 模組加載失敗: {e}")
 
+@st.cache_resource(show_spinner=False)
+def get_source_scheduler():
+    # 行程內共用一份統計 (跨使用者累積)，於每次查核完成後寫回檔案
+    from modules.scheduler import SourceScheduler
+    return SourceScheduler()
+
+@st.cache_resource(show_spinner=False)
+def get_paid_usage():
+    # 付費 API 的每日用量 (跨使用者共用)，每次查核另建工作預算
+    from modules.quota import PaidUsage
+    return PaidUsage()
+
+@st.cache_resource(show_spinner=False)
+def load_api_keys():
+    from modules.api_clients import get_scopus_key, get_serpapi_key
+    return get_scopus_key(), get_serpapi_key()
+
 # ========== 3. 頁面設定與 UI 樣式 ==========
 st.set_page_config(page_title="學術引用檢查器 (報表增強版)", page_icon="📊", layout="wide")
 
@@ -56,62 +69,30 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Session State
-if "results" not in st.session_state: st.session_state.results = []
-
-# ========== 4. 輔助函式 (人名與數據清理) ==========
-def format_name_field(data):
-    if not data: return None
-    try:
-        if isinstance(data, str):
-            if not (data.startswith('[') or data.startswith('{')): return data
-            data = ast.literal_eval(data)
-        names_list = []
-        items = [data] if isinstance(data, dict) else data
-        for item in items:
-            if isinstance(item, dict):
-                parts = [p for p in [item.get('family'), item.get('given')] if p]
-                names_list.append(", ".join(parts))
-            else: names_list.append(str(item))
-        return "; ".join(names_list)
-    except: return str(data)
-
-def refine_parsed_data(parsed_item):
-    item = parsed_item.copy()
-    raw_text = item.get('text', '').strip()
-    for key in ['doi', 'url', 'title', 'date']:
-        val = item.get(key)
-        if val and isinstance(val, str): item[key] = val.strip(' ,.;)]}>')
-        elif val is not None: item[key] = str(val)
-
-    title = item.get('title', '')
-    if not title or len(title) < 10:
-        abbr_match = re.search(r'^([A-Z0-9\-\.\s]{2,12}:\s*.+?)(?=\s*[,\[]|\s*Available|\s*\(|\bhttps?://|\.|$)', raw_text)
-        if abbr_match: item['title'] = abbr_match.group(1).strip()
-        else:
-            for k in ['publisher', 'container-title', 'journal']:
-                if item.get(k) and len(str(item[k])) > 15:
-                    item['title'] = str(item[k]).strip()
-                    break
-    
-    current_url = item.get('url')
-    if current_url and isinstance(current_url, str):
-        doi_match = re.search(r'(10\.\d{4,9}/[-._;()/:a-zA-Z0-9]+)', current_url)
-        if doi_match: item['doi'] = doi_match.group(1).strip('.')
+# results: 欄式 DataFrame (modules/report.py)；results_csv: 完成時產生一次的下載內容
+if "results" not in st.session_state: st.session_state.results = None
+if "results_csv" not in st.session_state: st.session_state.results_csv = None
+if "paid_summary" not in st.session_state: st.session_state.paid_summary = None
 
-    if item.get('authors'): item['authors'] = format_name_field(item['authors'])
-    return item
+# ========== 4. 查核流程 (資料清理見 modules/preprocess.py) ==========
+def check_single_task(idx, record, local_df, target_col, scopus_key, serpapi_key, scheduler=None, budget=None):
+    from modules.scheduler import DEFAULT_ORDER, reference_class
+    from modules.quota import BUDGET_EXHAUSTED
+    from modules.local_db import search_local_database
+    from modules.api_clients import (
+        search_crossref_by_doi, search_crossref_by_text, search_scopus_by_title,
+        search_scholar_by_title, search_scholar_by_ref_text,
+        search_s2_by_title, search_openalex_by_title, check_url_availability
+    )
 
-def check_single_task(idx, raw_ref, local_df, target_col, scopus_key, serpapi_key):
-    ref = refine_parsed_data(raw_ref)
-    title, text = ref.get('title', ''), ref.get('text', '')
-    search_query = title if (title and len(title) > 8) else text[:120]
-    doi, parsed_url = ref.get('doi'), ref.get('url')
-    first_author = ref['authors'].split(';')[0].split(',')[0].strip() if ref.get('authors') else ""
+    # record 為 preprocess_references 產出的 QueryRecord，欄位皆已清理完成
+    title, text, search_query = record.title, record.text, record.search_query
+    doi, parsed_url, first_author = record.doi, record.url, record.first_author
 
-    res = {"id": idx, "title": title, "text": text, "parsed": ref, "sources": {}, "found_at_step": None, "suggestion": None}
+    res = {"id": idx, "title": title, "text": text, "sources": {}, "found_at_step": None, "suggestion": None}
 
     # 0. Local DB
-    if bool(re.search(r'[\u4e00-\u9fff]', search_query)) and local_df is not None and title:
+    if record.has_cjk and local_df is not None and title:
         match_row, _ = search_local_database(local_df, target_col, title, threshold=0.85)
         if match_row is not None:
             res.update({"sources": {"Local DB": "匹配成功"}, "found_at_step": "0. Local Database"})
@@ -124,23 +105,46 @@ def check_single_task(idx, raw_ref, local_df, target_col, scopus_key, serpapi_ke
             res.update({"sources": {"Crossref": url}, "found_at_step": "1. Crossref (DOI)"})
             return res
 
-    for api_func, step_name in [
-        (lambda: search_crossref_by_text(search_query, first_author), "1. Crossref"),
-        (lambda: search_scopus_by_title(search_query, scopus_key) if scopus_key else (None, None), "2. Scopus"),
-        (lambda: search_openalex_by_title(search_query, first_author), "3. OpenAlex"),
-        (lambda: search_s2_by_title(search_query, first_author), "4. Semantic Scholar"),
-        (lambda: search_scholar_by_title(search_query, serpapi_key) if serpapi_key else (None, None), "5. Google Scholar")
-    ]:
+    # 各來源的查詢函式與步驟名稱 (步驟編號固定，實際查詢順序由 scheduler 依統計決定)
+    cascade = {
+        "Crossref": (lambda: search_crossref_by_text(search_query, first_author), "1. Crossref"),
+        "Scopus": (lambda: search_scopus_by_title(search_query, scopus_key, budget=budget), "2. Scopus"),
+        "OpenAlex": (lambda: search_openalex_by_title(search_query, first_author), "3. OpenAlex"),
+        "Semantic Scholar": (lambda: search_s2_by_title(search_query, first_author), "4. Semantic Scholar"),
+        "Google Scholar": (lambda: search_scholar_by_title(search_query, serpapi_key, budget=budget), "5. Google Scholar")
+    }
+    if not scopus_key or (budget and not budget.available("Scopus")): cascade.pop("Scopus")
+    if not serpapi_key or (budget and not budget.available("Google Scholar")): cascade.pop("Google Scholar")
+
+    class_keys = reference_class(record)
+    order = scheduler.order(class_keys, list(cascade)) if scheduler else [s for s in DEFAULT_ORDER if s in cascade]
+    attempts = []
+    for source in order:
+        api_func, step_name = cascade[source]
+        t0 = time.perf_counter()
         try:
-            url, _ = api_func()
-            if url:
-                res.update({"sources": {step_name.split(". ")[1]: url}, "found_at_step": step_name})
-                return res
-        except: pass
+            url, status = api_func()
+        except: url, status = None, None
+        # 預算不足而未發出的請求不計入統計
+        if status == BUDGET_EXHAUSTED: continue
+        attempts.append((source, bool(url), time.perf_counter() - t0))
+        if url:
+            res.update({"sources": {source: url}, "found_at_step": step_name})
+            break
+    if scheduler and attempts: scheduler.record_run(class_keys, attempts)
+    if res["found_at_step"]: return res
 
-    if serpapi_key:
-        url_r, _ = search_scholar_by_ref_text(text, serpapi_key, target_title=title)
-        if url_r: res["suggestion"] = url_r
+    # 備援查詢同樣計入每筆文獻的付費呼叫上限
+    paid_left = scheduler.paid_calls_left([a[0] for a in attempts]) if scheduler else 1
+    if serpapi_key and paid_left > 0:
+        # Google Scholar 備援：預算吃緊時延到所有文獻的主要查詢完成後再執行 (見 JobBudget.drain)
+        fallback = lambda: search_scholar_by_ref_text(text, serpapi_key, target_title=title, budget=budget)
+        if budget is None or budget.admits_fallback("Google Scholar"):
+            url_r, status = fallback()
+            if url_r: res["suggestion"] = url_r
+            elif status == BUDGET_EXHAUSTED: budget.skip()
+        else:
+            budget.defer(idx, "Google Scholar", fallback)
 
     if parsed_url and parsed_url.startswith('http'):
         if check_url_availability(parsed_url):
@@ -156,14 +160,15 @@ with st.sidebar:
     local_df, target_col = None, None
     if os.path.exists(DEFAULT_CSV_PATH):
         @st.cache_data
-        def read_data_cached(file): return load_csv_data(file)
+        def read_data_cached(file):
+            from modules.local_db import load_csv_data
+            return load_csv_data(file)
         local_df = read_data_cached(DEFAULT_CSV_PATH)
         if local_df is not None:
             st.success(f"✅ 已載入本地庫: {len(local_df)} 筆")
             target_col = "論文名稱" if "論文名稱" in local_df.columns else local_df.columns[0]
     
-    scopus_key = get_scopus_key()
-    serpapi_key = get_serpapi_key()
+    scopus_key, serpapi_key = load_api_keys()
     st.divider()
     st.caption("API 狀態確認:")
     st.write(f"Scopus: {'✅' if scopus_key else '❌'} | SerpAPI: {'✅' if serpapi_key else '❌'}")
@@ -179,34 +184,59 @@ if st.button("🚀 開始全自動核對並生成報表", type="primary", use_co
     if not raw_input:
         st.warning("⚠️ 請先貼上內容。")
     else:
-        st.session_state.results = []
+        st.session_state.results = None
+        st.session_state.results_csv = None
+        st.session_state.paid_summary = None
         with st.status("🔍 正在進行查核作業...", expanded=True) as status:
             status.write("正在解析引用格式...")
             _, struct_list = parse_references_with_anystyle(raw_input)
             
             if struct_list:
-                status.write(f"正在連線各大學術資料庫 (共 {len(struct_list)} 筆)...")
+                from modules.preprocess import preprocess_references
+                records = preprocess_references(struct_list)
+                status.write(f"正在連線各大學術資料庫 (共 {len(records)} 筆)...")
                 progress_bar = st.progress(0)
                 results_buffer = []
+                scheduler = get_source_scheduler()
+                paid_usage = get_paid_usage()
+                budget = paid_usage.new_job()
                 with ThreadPoolExecutor(max_workers=5) as executor:
-                    futures = {executor.submit(check_single_task, i+1, r, local_df, target_col, scopus_key, serpapi_key): i for i, r in enumerate(struct_list)}
+                    futures = {executor.submit(check_single_task, i+1, r, local_df, target_col, scopus_key, serpapi_key, scheduler, budget): i for i, r in enumerate(records)}
                     for i, future in enumerate(as_completed(futures)):
                         results_buffer.append(future.result())
-                        progress_bar.progress((i + 1) / len(struct_list))
+                        progress_bar.progress((i + 1) / len(records))
+                scheduler.save()
+
+                # 以剩餘預算補跑延後的 Google Scholar 備援查詢
+                suggestions = budget.drain()
+                if suggestions:
+                    for res in results_buffer:
+                        if suggestions.get(res["id"]): res["suggestion"] = suggestions[res["id"]]
+                paid_usage.save()
+                st.session_state.paid_summary = budget.summary()
                 
-                st.session_state.results = sorted(results_buffer, key=lambda x: x['id'])
+                from modules.report import build_results_table, export_csv
+                st.session_state.results = build_results_table(results_buffer)
+                st.session_state.results_csv = export_csv(st.session_state.results)
                 status.update(label="✅ 核對作業完成！", state="complete", expanded=False)
             else:
                 st.error("❌ AnyStyle 解析異常。")
 
 # 3. 報表顯示與下載區
-if st.session_state.results:
+if st.session_state.results is not None and len(st.session_state.results):
+    from modules.report import (
+        STATUS_VERIFIED, STATUS_WEBSITE, STATUS_LINK_FAILED, STATUS_NOT_FOUND, STATUS_ICONS,
+        count_by_status, filter_by_status
+    )
+    results_df = st.session_state.results
+    status_counts = count_by_status(results_df)
+
     st.divider()
     st.markdown("### 📊 第二步：查核結果與報表下載")
     
     # 統計卡片
-    total_refs = len(st.session_state.results)
-    verified_db = sum(1 for r in st.session_state.results if r.get('found_at_step') and "6." not in r.get('found_at_step'))
+    total_refs = len(results_df)
+    verified_db = status_counts[STATUS_VERIFIED]
     failed_refs = total_refs - verified_db
     
     col1, col2, col3 = st.columns(3)
@@ -214,19 +244,19 @@ if st.session_state.results:
     col2.metric("資料庫匹配成功", verified_db)
     col3.metric("需人工確認/修正", failed_refs, delta_color="inverse")
 
-    # 下載報表（維持原樣）
-    df_export = pd.DataFrame([{
-        "ID": r['id'],
-        "狀態": r['found_at_step'] if r['found_at_step'] else "未找到",
-        "抓取標題": r['title'],
-        "原始文獻內容": r['text'],
-        "驗證來源連結": next(iter(r['sources'].values()), "N/A") if r['sources'] else "N/A"
-    } for r in st.session_state.results])
+    # 付費 API 用量 (本次查核)
+    paid = st.session_state.paid_summary
+    if paid:
+        used = "、".join(f"{k} {v} 次" for k, v in paid["used"].items()) or "無"
+        st.caption(
+            f"付費 API 呼叫：{used}｜同步查詢合併省下 {paid['saved']} 次｜"
+            f"預算不足略過 {paid['skipped']} 筆備援查詢 (延後 {paid['deferred']} 筆)"
+        )
 
-    csv_data = df_export.to_csv(index=False).encode('utf-8-sig')
+    # 下載報表（CSV 於查核完成時產生一次並快取）
     st.download_button(
         label="📥 下載完整查核報告 (Excel 可開 CSV)",
-        data=csv_data,
+        data=st.session_state.results_csv,
         file_name=f"Citation_Check_{time.strftime('%Y%m%d_%H%M')}.csv",
         mime="text/csv",
         use_container_width=True
@@ -237,55 +267,54 @@ if st.session_state.results:
     st.markdown("#### 🔍 查核清單明細")
     
     # 同學要求的五種過濾狀態
+    filter_statuses = {
+        "全部顯示": None,
+        "✅ 資料庫驗證": STATUS_VERIFIED,
+        "🌐 網站有效來源": STATUS_WEBSITE,
+        "⚠️ 網站 (連線失敗)": STATUS_LINK_FAILED,
+        "❌ 未找到結果": STATUS_NOT_FOUND,
+    }
     filter_option = st.radio(
         "顯示篩選項目：",
-        ["全部顯示", "✅ 資料庫驗證", "🌐 網站有效來源", "⚠️ 網站 (連線失敗)", "❌ 未找到結果"],
+        list(filter_statuses.keys()),
         horizontal=True
     )
 
-    # 執行過濾邏輯
-    filtered_results = []
-    for r in st.session_state.results:
-        step = r.get('found_at_step', '')
-        if filter_option == "全部顯示":
-            filtered_results.append(r)
-        elif filter_option == "✅ 資料庫驗證" and step and "6." not in step and "Failed" not in step:
-            filtered_results.append(r)
-        elif filter_option == "🌐 網站有效來源" and "6." in step and "Failed" not in step:
-            filtered_results.append(r)
-        elif filter_option == "⚠️ 網站 (連線失敗)" and "Failed" in step:
-            filtered_results.append(r)
-        elif filter_option == "❌ 未找到結果" and not step:
-            filtered_results.append(r)
-
-    # 顯示列表
-    if not filtered_results:
+    # 執行過濾邏輯 (以預先計算的 status 欄位做布林遮罩)
+    filtered_df = filter_by_status(results_df, filter_statuses[filter_option])
+
+    # 顯示列表 (分頁，只渲染目前頁面的項目)
+    if filtered_df.empty:
         st.info(f"目前沒有符合「{filter_option}」的項目。")
     else:
-        for item in filtered_results:
-            step = item.get('found_at_step', '')
+        page_col, size_col = st.columns([3, 1])
+        page_size = size_col.selectbox("每頁筆數", [20, 50, 100], index=0)
+        total_pages = (len(filtered_df) - 1) // page_size + 1
+        # 每種篩選與每頁筆數各自記住頁碼，避免切換後超出範圍
+        page = page_col.number_input(
+            f"頁碼 (共 {total_pages} 頁，{len(filtered_df)} 筆)",
+            min_value=1, max_value=total_pages, value=1, step=1,
+            key=f"page_{filter_option}_{page_size}"
+        )
+        page_df = filtered_df.iloc[(page - 1) * page_size : page * page_size]
+
+        for item in page_df.itertuples(index=False):
+            step = item.found_at_step
             # 根據狀態決定圖示
-            if not step:
-                status_icon = "❌"
-            elif "Failed" in step:
-                status_icon = "⚠️"
-            elif "6." in step:
-                status_icon = "🌐"
-            else:
-                status_icon = "✅"
+            status_icon = STATUS_ICONS[item.status]
 
-            with st.expander(f"{status_icon} ID {item['id']}：{item['text'][:80]}..."):
-                st.markdown(f"**查核結果：** `{step if step else '資料庫未匹配'}`")
-                st.markdown(f"**原始內容：**")
-                st.markdown(f"<div class='ref-box'>{item['text']}</div>", unsafe_allow_html=True)
-                
-                if item['sources']:
-                    st.markdown("**來源連結：**")
-                    for src, link in item['sources'].items():
-                        st.write(f"- {src}: {link}")
+            with st.expander(f"{status_icon} ID {item.id}：{item.text[:80]}..."):
+                # 內容合併為單一 markdown 元素，減少每次重跑送出的元素數量
+                body = (
+                    f"**查核結果：** `{step if step else '資料庫未匹配'}`\n\n"
+                    f"**原始內容：**\n\n<div class='ref-box'>{item.text}</div>"
+                )
+                if item.source_name:
+                    body += f"\n\n**來源連結：**\n- {item.source_name}: {item.source_link}"
+                st.markdown(body, unsafe_allow_html=True)
                 
-                if (not step or "Failed" in step) and item.get("suggestion"):
-                    st.warning(f"💡 模糊搜尋建議：[請點此手動確認相似文獻]({item['suggestion']})")
+                if item.status in (STATUS_NOT_FOUND, STATUS_LINK_FAILED) and item.suggestion:
+                    st.warning(f"💡 模糊搜尋建議：[請點此手動確認相似文獻]({item.suggestion})")
 
 else:
     st.info("💡 目前尚無結果。請在上方輸入框貼上文獻，並點擊按鈕開始。")
@@ -0,0 +1,201 @@
+# benchmarks/bench_crf.py
+# 行程內 CRF 引擎 (modules/crf.py) 的一致性檢查與吞吐量比較
+# 使用方式（於專案根目錄）：python benchmarks/bench_crf.py [筆數]
+#   1. 解碼一致性：同一組特徵交給 Wapiti 原生程式 (環境變數 WAPITI_BIN) 標註，比較標籤
+#   2. 與 AnyStyle 的特徵/標籤一致性：比對 crf_anystyle_fixture.txt (以 record_anystyle_fixture.rb
+#      由 AnyStyle 本身記錄)；字典取自 anystyle-data gem 或環境變數 ANYSTYLE_DICT
+#   3. position 特徵的捨入與 Ruby Float#round 比對 (需 ruby)
+#   4. 吞吐量：行程內批次 vs 每筆啟動一次 CLI 子行程 (需 anystyle 指令)
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from modules.crf import CRFParser, _position, find_anystyle_dictionary, token_features, tokenize
+
+MODEL_PATH = os.path.join(ROOT, "custom.mod")
+CORPUS_PATH = os.path.join(ROOT, "benchmarks", "crf_corpus.txt")
+
+FIXTURE_PATH = os.path.join(ROOT, "benchmarks", "crf_anystyle_fixture.txt")
+
+FEATURE_NAMES = [
+    "token", "canonical", "category-first", "category-last", "prefix-1", "prefix-2", "suffix-1", "suffix-2",
+    "caps", "number", "dict-name", "dict-place", "dict-publisher", "dict-journal", "keyword", "position",
+    "punctuation", "brackets", "terminal", "locator",
+]
+DICTIONARY_COLUMNS = {"dict-name", "dict-place", "dict-publisher", "dict-journal"}
+
+
+def agreement(native, expected):
+    same_tokens = total_tokens = same_seqs = 0
+    mismatches = []
+    for i, (got, ref) in enumerate(zip(native, expected)):
+        same_tokens += sum(a == b for a, b in zip(got, ref))
+        total_tokens += max(len(got), len(ref))
+        if got == ref:
+            same_seqs += 1
+        else:
+            mismatches.append((i, got, ref))
+    return same_tokens / max(total_tokens, 1), same_seqs, mismatches
+
+
+def run_wapiti_labels(wapiti_bin, parser, lines):
+    """
+    把 token_features 產生的特徵寫成 Wapiti 的輸入格式 (每行一個 token，空行分隔序列)，
+    以原生 wapiti label 解碼，只比較模型載入與 Viterbi 的部分。
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        in_path, out_path = os.path.join(tmp, "in.txt"), os.path.join(tmp, "out.txt")
+        with open(in_path, "w", encoding="utf-8") as f:
+            for line in lines:
+                for row in token_features(tokenize(line), parser.dictionary):
+                    f.write(" ".join(row) + "\n")
+                f.write("\n")
+        subprocess.run([wapiti_bin, "label", "-m", MODEL_PATH, in_path, out_path], capture_output=True, check=True)
+        seqs = [[]]
+        with open(out_path, encoding="utf-8") as f:
+            for row in f:
+                row = row.rstrip("\n")
+                if row:
+                    seqs[-1].append(row.split()[-1])
+                elif seqs[-1]:
+                    seqs.append([])
+    return [s for s in seqs if s]
+
+
+def load_fixture(path):
+    """
+    讀取 record_anystyle_fixture.rb 的輸出，回傳 [[(特徵列, 標籤), ...], ...] (每個序列一個列表)。
+    """
+    seqs = [[]]
+    with open(path, encoding="utf-8") as f:
+        for row in f:
+            row = row.rstrip("\n")
+            if row.startswith("#"):
+                continue
+            if row:
+                cols = row.split("\t")
+                seqs[-1].append((cols[:-1], cols[-1]))
+            elif seqs[-1]:
+                seqs.append([])
+    return [s for s in seqs if s]
+
+
+def compare_fixture(parser, corpus, fixture):
+    """
+    逐欄比對特徵，再比對標籤 (行程內 CRF 的標籤 vs AnyStyle 的標籤)。
+    """
+    if len(fixture) != len(corpus):
+        print(f"[AnyStyle] 紀錄檔有 {len(fixture)} 筆，語料有 {len(corpus)} 筆，請重新記錄")
+        return
+    column_diffs = {name: 0 for name in FEATURE_NAMES}
+    examples = {}
+    total = 0
+    for line, expected in zip(corpus, fixture):
+        rows = token_features(tokenize(line), parser.dictionary)
+        if len(rows) != len(expected):
+            print(f"  token 數不一致 ({len(rows)} / {len(expected)}): {line}")
+            continue
+        for row, (ref, _) in zip(rows, expected):
+            total += 1
+            for name, got, want in zip(FEATURE_NAMES, row, ref):
+                if got != want:
+                    column_diffs[name] += 1
+                    examples.setdefault(name, (row[0], got, want))
+    print(f"[AnyStyle] 特徵一致性 ({total} 個 token):")
+    for name in FEATURE_NAMES:
+        if column_diffs[name]:
+            tok, got, want = examples[name]
+            note = " (未載入字典)" if name in DICTIONARY_COLUMNS and not parser.dictionary else ""
+            print(f"  {name}: {column_diffs[name]} 個不一致{note}，例如 {tok}: CRF={got} AnyStyle={want}")
+    if not any(column_diffs.values()):
+        print("  全部一致")
+
+    native = [[label for _, label in seq] for seq in parser.label_batch(corpus)]
+    token_rate, same, mismatches = agreement(native, [[label for _, label in seq] for seq in fixture])
+    print(f"[AnyStyle] 標籤一致率: token {token_rate:.2%}, 整筆 {same}/{len(corpus)}")
+    for i, got, ref in mismatches:
+        print(f"  不一致: {corpus[i]}\n    CRF     : {' '.join(got)}\n    AnyStyle: {' '.join(ref)}")
+
+
+def check_ruby_rounding(max_length=300):
+    """
+    position 特徵為 (idx / 長度 * 10).round：以 Ruby 實際計算結果比對 modules.crf._position。
+    """
+    script = "(2..ARGV[0].to_i).each { |l| (1..l-2).each { |i| puts (i / l.to_f * 10).round } }"
+    result = subprocess.run(["ruby", "-e", script, str(max_length)], capture_output=True, text=True, check=True)
+    expected = result.stdout.split()
+    got = [_position(i, l) for l in range(2, max_length + 1) for i in range(1, l - 1)]
+    diffs = sum(a != b for a, b in zip(got, expected))
+    print(f"[Ruby] position 捨入 ({len(expected)} 組): {'一致' if diffs == 0 and len(got) == len(expected) else f'{diffs} 組不一致'}")
+
+
+def time_subprocess(lines):
+    """
+    比照 parsers.parse_references_with_anystyle：每筆文獻啟動一次 CLI。
+    """
+    start = time.perf_counter()
+    for line in lines:
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".txt", delete=False, encoding="utf-8") as tmp:
+            tmp.write(line)
+            tmp_path = tmp.name
+        try:
+            subprocess.run(["anystyle", "-f", "json", "-P", MODEL_PATH, "parse", tmp_path],
+                           capture_output=True, text=True, encoding="utf-8", check=True)
+        finally:
+            os.remove(tmp_path)
+    return time.perf_counter() - start
+
+
+def main(n=2000):
+    corpus = [line.strip() for line in open(CORPUS_PATH, encoding="utf-8") if line.strip()]
+    lines = [corpus[i % len(corpus)] for i in range(n)]
+
+    dictionary = os.environ.get("ANYSTYLE_DICT") or find_anystyle_dictionary()
+    start = time.perf_counter()
+    parser = CRFParser(MODEL_PATH, dictionary)
+    print(f"模型載入: {(time.perf_counter() - start) * 1000:.1f} ms "
+          f"({len(parser.model.labels)} 標籤, {len(parser.model.observations)} 觀測)")
+    print(f"AnyStyle 字典: {dictionary or '未找到 (字典特徵全部為 F)'}")
+
+    start = time.perf_counter()
+    parser.label_batch(lines)
+    elapsed = time.perf_counter() - start
+    print(f"行程內 CRF: {n} 筆 {elapsed:.2f} s ({n / elapsed:.0f} 筆/秒)")
+
+    native = [[label for _, label in seq] for seq in parser.label_batch(corpus)]
+
+    wapiti_bin = os.environ.get("WAPITI_BIN")
+    if wapiti_bin:
+        token_rate, same, mismatches = agreement(native, run_wapiti_labels(wapiti_bin, parser, corpus))
+        print(f"[解碼] 與 Wapiti 原生程式一致率: token {token_rate:.2%}, 整筆 {same}/{len(corpus)}")
+        for i, got, ref in mismatches:
+            print(f"  不一致: {corpus[i]}\n    CRF   : {' '.join(got)}\n    Wapiti: {' '.join(ref)}")
+    else:
+        print("[解碼] 未設定 WAPITI_BIN，略過與 Wapiti 原生程式的比較")
+
+    if os.path.exists(FIXTURE_PATH):
+        compare_fixture(parser, corpus, load_fixture(FIXTURE_PATH))
+    else:
+        print("[AnyStyle] 尚無 crf_anystyle_fixture.txt，請先以 benchmarks/record_anystyle_fixture.rb 記錄")
+
+    try:
+        check_ruby_rounding()
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"[Ruby] 無法執行 ruby，略過 position 捨入比對: {e}")
+
+    sample = lines[:min(n, 50)]
+    try:
+        elapsed_cli = time_subprocess(sample)
+    except (OSError, subprocess.CalledProcessError) as e:
+        reason = (getattr(e, "stderr", "") or str(e)).strip().splitlines()[0]
+        print(f"[CLI] 無法執行 anystyle 指令，略過子行程比較: {reason}")
+        return
+    print(f"AnyStyle 子行程: {len(sample)} 筆 {elapsed_cli:.2f} s ({len(sample) / elapsed_cli:.1f} 筆/秒)")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,66 @@
+# benchmarks/bench_preprocess.py
+# 批次前處理 (preprocess_references) 與逐筆版 (preprocess_reference) 的一致性檢查與效能比較
+# 使用方式（於專案根目錄）：python benchmarks/bench_preprocess.py [筆數]
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from modules.preprocess import preprocess_reference, preprocess_references
+
+CORPUS_PATH = os.path.join(ROOT, "benchmarks", "preprocess_corpus.json")
+REPEAT = 3     # 各跑數次取中位數
+
+
+def build_corpus(n, seed=0):
+    """
+    以回歸語料為基礎，隨機混搭欄位產生 n 筆 AnyStyle 格式的資料。
+    """
+    base = json.load(open(CORPUS_PATH, encoding="utf-8"))
+    keys = sorted({k for item in base for k in item})
+    pools = {k: [item[k] for item in base if k in item] for k in keys}
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(n):
+        item = dict(base[i % len(base)])
+        for k in rng.sample(keys, 2):
+            if rng.random() < 0.3:
+                item.pop(k, None)
+            else:
+                item[k] = rng.choice(pools[k])
+        item["text"] = item.get("text") or f"Reference {i}"
+        corpus.append(item)
+    return corpus
+
+
+def main(n=100_000):
+    base = json.load(open(CORPUS_PATH, encoding="utf-8"))
+    assert preprocess_references(base) == [preprocess_reference(r) for r in base], "回歸語料輸出不一致"
+    print(f"回歸語料 ({len(base)} 筆): 輸出一致")
+
+    corpus = build_corpus(n)
+
+    def timed(fn):
+        times, result = [], None
+        for _ in range(REPEAT):
+            t0 = time.perf_counter()
+            result = fn()
+            times.append(time.perf_counter() - t0)
+        return result, statistics.median(times)
+
+    expected, t_item = timed(lambda: [preprocess_reference(r) for r in corpus])
+    actual, t_batch = timed(lambda: preprocess_references(corpus))
+
+    assert actual == expected, "隨機語料輸出不一致"
+    print(f"隨機語料 ({n} 筆): 輸出一致")
+    print(f"逐筆版 (中位數): {t_item:.3f} s")
+    print(f"批次版 (中位數): {t_batch:.3f} s ({t_item / t_batch:.1f}x)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,71 @@
+# benchmarks/check_quota.py
+# 付費 API 用量控制 (modules/quota.py) 的多執行緒檢查：同步查詢合併、工作/每日預算、延後佇列
+# 以假的 SerpAPI 查詢取代網路呼叫，不需要 API Key
+# 使用方式（於專案根目錄）：python benchmarks/check_quota.py
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import modules.api_clients as api_clients
+from modules.quota import BUDGET_EXHAUSTED, PaidUsage
+
+CALL_DELAY = 0.2
+calls = []
+calls_lock = threading.Lock()
+
+
+def fake_search(title, api_key):
+    with calls_lock:
+        calls.append(title)
+    time.sleep(CALL_DELAY)
+    return f"https://scholar.example/{title}", "match"
+
+
+def check(name, ok, detail):
+    print(f"[{'OK' if ok else 'FAIL'}] {name}: {detail}")
+    return ok
+
+
+def main():
+    api_clients._search_scholar_by_title = fake_search
+    usage = PaidUsage(path=None, daily_limits={"Google Scholar": 5})
+    budget = usage.new_job(job_limits={"Google Scholar": 3}, fallback_reserve=0)
+
+    # 1. 8 個執行緒同時查詢 2 個題目：每個題目只應發出一次請求
+    titles = ["Title A", "Title B"] * 4
+    with ThreadPoolExecutor(max_workers=len(titles)) as executor:
+        results = list(executor.map(lambda t: api_clients.search_scholar_by_title(t, "key", budget=budget), titles))
+    summary = budget.summary()
+    passed = check("同步查詢合併", len(calls) == 2 and summary["saved"] == 6 and all(s == "match" for _, s in results),
+                   f"實際呼叫 {len(calls)} 次，共用 {summary['saved']} 次")
+
+    # 2. 工作預算 3 次：第 3 個新題目可查，第 4 個被拒
+    _, status_c = api_clients.search_scholar_by_title("Title C", "key", budget=budget)
+    _, status_d = api_clients.search_scholar_by_title("Title D", "key", budget=budget)
+    summary = budget.summary()
+    passed &= check("工作預算", status_c == "match" and status_d == BUDGET_EXHAUSTED and summary["denied"] == 1,
+                    f"已用 {summary['used']}，拒絕 {summary['denied']} 次")
+
+    # 3. 額度用盡後延後的備援查詢於 drain 時略過，不發出請求
+    budget.defer(0, "Google Scholar", lambda: api_clients.search_scholar_by_title("Title E", "key", budget=budget))
+    drained = budget.drain()
+    summary = budget.summary()
+    passed &= check("延後佇列", not drained and summary["skipped"] == 1 and len(calls) == 3,
+                    f"延後 {summary['deferred']} 筆，略過 {summary['skipped']} 筆")
+
+    # 4. 每日上限跨工作共用：前一個工作用掉 3 次，新工作只剩 2 次
+    next_job = usage.new_job(job_limits={"Google Scholar": 3}, fallback_reserve=0)
+    statuses = [api_clients.search_scholar_by_title(f"Title {i}", "key", budget=next_job)[1] for i in range(3)]
+    passed &= check("每日預算", statuses == ["match", "match", BUDGET_EXHAUSTED],
+                    f"新工作可用 {statuses.count('match')} 次，今日累計 {dict(usage.calls)}")
+
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# benchmarks/eval_source_order.py
+# 以查核紀錄 (source_runs.jsonl) 離線比較「固定順序」與「自適應順序」的平均驗證耗時
+# 使用方式（於專案根目錄）：
+#   python benchmarks/eval_source_order.py [紀錄檔] [付費 API 上限]
+#   python benchmarks/eval_source_order.py --simulate [筆數]   (以模擬紀錄評估，結果見 source_order_eval.txt)
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from modules.scheduler import RUNS_PATH, DEFAULT_ORDER, MAX_PAID_CALLS_PER_REF, load_runs, evaluate_offline
+
+# 模擬用的文獻類別：(比例, {來源: (命中率, 平均延遲秒數)})
+SIMULATED_CLASSES = {
+    ("latin", "latin|doi", "latin|doi|article-journal", "latin|doi|article-journal|-"): (0.40, {
+        "Crossref": (0.85, 1.0), "Scopus": (0.75, 0.8), "OpenAlex": (0.70, 0.6),
+        "Semantic Scholar": (0.60, 1.8), "Google Scholar": (0.80, 2.5),
+    }),
+    ("latin", "latin|nodoi", "latin|nodoi|book", "latin|nodoi|book|-"): (0.35, {
+        "Crossref": (0.35, 1.2), "Scopus": (0.55, 0.8), "OpenAlex": (0.50, 0.7),
+        "Semantic Scholar": (0.45, 1.8), "Google Scholar": (0.75, 2.5),
+    }),
+    ("cjk", "cjk|nodoi", "cjk|nodoi|thesis", "cjk|nodoi|thesis|-"): (0.25, {
+        "Crossref": (0.05, 1.2), "Scopus": (0.10, 0.8), "OpenAlex": (0.20, 0.7),
+        "Semantic Scholar": (0.08, 1.8), "Google Scholar": (0.55, 2.5),
+    }),
+}
+
+
+def simulate_runs(n, seed=0):
+    """
+    產生 n 筆模擬紀錄：每筆文獻以隨機順序查過全部來源 (命中不停止)，
+    因此「實測重播」可涵蓋全部紀錄。各來源命中彼此獨立、延遲在平均值的 0.5~1.5 倍間均勻分布。
+    """
+    rng = random.Random(seed)
+    classes = list(SIMULATED_CLASSES.items())
+    runs = []
+    for i in range(n):
+        class_keys, (_, sources) = rng.choices(classes, weights=[w for _, (w, _) in classes])[0]
+        order = list(DEFAULT_ORDER)
+        rng.shuffle(order)
+        attempts = []
+        for source in order:
+            p, c = sources[source]
+            attempts.append([source, rng.random() < p, round(c * rng.uniform(0.5, 1.5), 4)])
+        runs.append({"ts": i, "class": list(class_keys), "attempts": attempts})
+    return runs
+
+
+def main(runs, max_paid_calls=MAX_PAID_CALLS_PER_REF):
+    if len(runs) < 2:
+        print("紀錄不足，請先以 app.py 完成幾次查核。")
+        return
+    results = evaluate_offline(runs, max_paid_calls=max_paid_calls)
+    labels = {
+        "observed": "實測重播 (僅限查過全部來源的紀錄，無模型假設)",
+        "estimated": "模型估計 (未查詢的來源以統計估計值補上，節省幅度偏高)",
+    }
+    for mode in ("observed", "estimated"):
+        r = results[mode]
+        print(f"== {labels[mode]}：{r['n']} 筆")
+        if not r["n"]:
+            continue
+        for name, title in (("static", "固定順序"), ("adaptive", "自適應順序")):
+            cost, hits, paid = r[name]
+            print(f"  {title}: 平均 {cost:.3f} s，命中率 {hits:.1%}，付費呼叫 {paid:.2f} 次/筆")
+        static_cost, adaptive_cost = r["static"][0], r["adaptive"][0]
+        if static_cost:
+            print(f"  耗時節省: {(1 - adaptive_cost / static_cost) * 100:.1f}%")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--simulate":
+        main(simulate_runs(int(sys.argv[2]) if len(sys.argv) > 2 else 4000))
+    else:
+        main(
+            load_runs(sys.argv[1] if len(sys.argv) > 1 else os.path.join(ROOT, RUNS_PATH)),
+            int(sys.argv[2]) if len(sys.argv) > 2 else MAX_PAID_CALLS_PER_REF,
+        )
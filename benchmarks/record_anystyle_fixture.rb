@@ -0,0 +1,32 @@
+# benchmarks/record_anystyle_fixture.rb
+# 以 AnyStyle 本身記錄 crf_corpus.txt 每個 token 的特徵與標籤 (crf_anystyle_fixture.txt)，
+# 供 benchmarks/bench_crf.py 逐欄比對行程內 CRF 的特徵與標籤。
+# 需要 anystyle gem 與 anystyle-data 字典；專案的 Dockerfile 已安裝 anystyle-cli：
+#   docker build -t reference-check-anystyle .
+#   docker run --rm -v "$PWD":/app --entrypoint ruby reference-check-anystyle benchmarks/record_anystyle_fixture.rb
+require 'anystyle'
+
+root = File.expand_path('..', __dir__)
+model = File.join(root, 'custom.mod')
+corpus = File.join(root, 'benchmarks', 'crf_corpus.txt')
+fixture = File.join(root, 'benchmarks', 'crf_anystyle_fixture.txt')
+
+lines = File.readlines(corpus, encoding: 'utf-8').map(&:strip).reject(&:empty?)
+parser = AnyStyle::Parser.new(model: model)
+
+# 特徵 (prepare 的結果) 與標籤 (label 的結果) 分開取得，逐筆對齊
+prepared = parser.prepare(lines.join("\n"))
+labeled = parser.label(lines.join("\n"))
+abort "序列數不一致: #{prepared.length} / #{labeled.length}" unless prepared.length == labeled.length
+
+File.open(fixture, 'w:utf-8') do |f|
+  f.puts "# anystyle #{AnyStyle::VERSION}, wapiti #{Wapiti::VERSION}, ruby #{RUBY_VERSION}"
+  f.puts "# 每行: token<TAB>特徵 1..19<TAB>標籤；空行分隔序列"
+  prepared.each.with_index do |seq, i|
+    seq.tokens.zip(labeled[i].tokens).each do |tok, out|
+      f.puts [tok.value, *tok.observations, out.label].join("\t")
+    end
+    f.puts
+  end
+end
+puts "已寫入 #{fixture} (#{lines.length} 筆)"
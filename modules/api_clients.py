@@ -3,11 +3,11 @@ import streamlit as st
 import requests
 import time
 from difflib import SequenceMatcher
-from serpapi import GoogleSearch
-import urllib3
 
 # 導入標題清洗函式
 from .parsers import clean_title
+# 付費 API 的同步查詢合併與預算控制
+from .quota import paid_call
 
 # --- 全域 API 設定 ---
 S2_API_URL = "https://api.semanticscholar.org/graph/v1/paper/search"
@@ -107,8 +107,11 @@ def search_crossref_by_text(title, author=None):
 
 # ========== 2. Scopus ==========
 
-def search_scopus_by_title(title, api_key):
+def search_scopus_by_title(title, api_key, budget=None):
     if not api_key: return None, "No API Key"
+    return paid_call("Scopus", ("title", title, api_key), lambda: _search_scopus_by_title(title, api_key), budget)
+
+def _search_scopus_by_title(title, api_key):
     url = "https://api.elsevier.com/content/search/scopus"
     headers = {"Accept": "application/json", "X-ELS-APIKey": api_key}
     params = {"query": f'TITLE("{title}")', "count": 1}
@@ -127,10 +130,14 @@ def search_scopus_by_title(title, api_key):
 
 # ========== 3. Google Scholar ==========
 
-def search_scholar_by_title(title, api_key):
+def search_scholar_by_title(title, api_key, budget=None):
     if not api_key: return None, "No API Key"
+    return paid_call("Google Scholar", ("title", title, api_key), lambda: _search_scholar_by_title(title, api_key), budget)
+
+def _search_scholar_by_title(title, api_key):
     params = {"engine": "google_scholar", "q": title, "api_key": api_key, "num": 3}
     try:
+        from serpapi import GoogleSearch
         results = GoogleSearch(params).get_dict()
         organic = results.get("organic_results", [])
         for res in organic:
@@ -139,10 +146,17 @@ def search_scholar_by_title(title, api_key):
         return None, "No exact match found"
     except Exception as e: return None, str(e)
 
-def search_scholar_by_ref_text(ref_text, api_key, target_title=None):
+def search_scholar_by_ref_text(ref_text, api_key, target_title=None, budget=None):
     if not api_key: return None, "No API Key"
+    return paid_call(
+        "Google Scholar", ("ref_text", ref_text, target_title, api_key),
+        lambda: _search_scholar_by_ref_text(ref_text, api_key, target_title), budget
+    )
+
+def _search_scholar_by_ref_text(ref_text, api_key, target_title=None):
     params = {"engine": "google_scholar", "q": ref_text, "api_key": api_key, "num": 1}
     try:
+        from serpapi import GoogleSearch
         results = GoogleSearch(params).get_dict()
         organic = results.get("organic_results", [])
         if organic:
@@ -192,6 +206,7 @@ def search_openalex_by_title(title, author=None):
 
 def check_url_availability(url):
     if not url or not url.startswith("http"): return False
+    import urllib3
     urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
     try:
         resp = requests.head(url, timeout=5, allow_redirects=True, verify=False)
@@ -0,0 +1,486 @@
+# modules/crf.py
+# 純 Python/NumPy 的 Wapiti CRF 推論引擎：直接載入 AnyStyle 的 custom.mod，
+# 產生與 AnyStyle 相同的 token 特徵，並以批次 Viterbi 解碼，不需呼叫 Ruby 子行程。
+
+import gzip
+import math
+import os
+import re
+import subprocess
+import unicodedata
+
+import numpy as np
+
+# ========== 1. 模型載入 ==========
+# Wapiti 模型檔格式 (mdl/rdr/qrk 區段)：
+#   #mdl#<type>#<nact>        模型型別與非零權重數
+#   #rdr#<npats>/<ntoks>/<autouni>
+#   <len>:<pattern>,          特徵樣板，共 npats 行
+#   #qrk#<n> + n 行           標籤字典
+#   #qrk#<n> + n 行           觀測字串字典
+#   <index>=<weight>          非零權重
+# 觀測字串以 'u' 開頭為 unigram，'b' 為 bigram，'*' 兩者皆有；
+# 權重位置依觀測順序累加：unigram 佔 Y 格，bigram 佔 Y*Y 格。
+
+PATTERN_ITEM = re.compile(r'%([xXtTmM])\[(@?)\s*(-?\d+)\s*,\s*(\d+)\s*(?:,\s*"((?:[^"\\]|\\.)*)"\s*)?\]')
+ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+# 超出序列範圍的位置以特殊值代替，距離 5 以上統一為 _x-# / _x+# (同 Wapiti pat_exec)
+BEFORE_VALUES = ["_x-1", "_x-2", "_x-3", "_x-4", "_x-#"]
+AFTER_VALUES = ["_x+1", "_x+2", "_x+3", "_x+4", "_x+#"]
+
+
+def _read_counted(lines, pos):
+    """
+    讀取 '<len>:<字串>,' 格式的一行。len 為 UTF-8 位元組數 (字串本身可能含逗號，故依長度切割)。
+    """
+    line = lines[pos]
+    size, rest = line.split(":", 1)
+    return rest.encode("utf-8")[:int(size)].decode("utf-8"), pos + 1
+
+
+class Pattern:
+    """
+    單一 Wapiti 特徵樣板，例如 'u:tok-2 L=%X[-1,0]/%X[ 0,0]'。
+    指令大寫 (%X/%T/%M) 表示結果轉小寫 (只轉 ASCII，同 C 的 tolower)。
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.parts = []     # 交錯的字面字串與 (指令, 是否絕對位置, 位移, 欄位, 正規式, 是否轉小寫)
+        last = 0
+        for m in PATTERN_ITEM.finditer(source):
+            self.parts.append(source[last:m.start()])
+            cmd, absolute, off, col, regex = m.group(1), bool(m.group(2)), int(m.group(3)), int(m.group(4)), m.group(5)
+            self.parts.append((cmd.lower(), absolute, off, col, re.compile(regex) if regex is not None else None, cmd.isupper()))
+            last = m.end()
+        self.parts.append(source[last:])
+
+    def apply(self, rows, t):
+        T = len(rows)
+        out = []
+        for part in self.parts:
+            if isinstance(part, str):
+                out.append(part)
+                continue
+            cmd, absolute, off, col, regex, caps = part
+            if absolute:
+                pos = off + T if off < 0 else off - 1
+            else:
+                pos = t + off
+            if pos < 0:
+                value = BEFORE_VALUES[min(-pos - 1, 4)]
+            elif pos >= T:
+                value = AFTER_VALUES[min(pos - T, 4)]
+            else:
+                value = rows[pos][col]
+            if cmd == "t":
+                # %t 測試正規式是否匹配 (true/false)，%m 取出匹配的內容
+                value = "true" if regex.search(value) else "false"
+            elif cmd == "m":
+                m = regex.search(value)
+                value = m.group(0) if m else ""
+            out.append(value.translate(ASCII_LOWER) if caps else value)
+        return "".join(out)
+
+
+class WapitiModel:
+    """
+    Wapiti CRF 模型 (僅推論)。權重展開為稠密陣列：
+    unigram: (觀測數, Y)；bigram: (觀測數, Y, Y)，沒有該類權重的觀測為 0。
+    """
+
+    def __init__(self, patterns, labels, observations, weights):
+        self.patterns = [Pattern(p) for p in patterns]
+        self.labels = labels
+        self.observations = {o: i for i, o in enumerate(observations)}
+        Y, O = len(labels), len(observations)
+        self.unigram = np.zeros((O, Y))
+        self.bigram = np.zeros((O, Y, Y))
+        self.has_bigram = np.zeros(O, dtype=bool)
+
+        offset = 0
+        for o, obs in enumerate(observations):
+            kind = {"u": 1, "b": 2, "*": 3}.get(obs[:1], 1)
+            if kind & 1:
+                self.unigram[o] = weights[offset:offset + Y]
+                offset += Y
+            if kind & 2:
+                self.bigram[o] = weights[offset:offset + Y * Y].reshape(Y, Y)
+                self.has_bigram[o] = True
+                offset += Y * Y
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.read().split("\n")
+        header = lines[0].split("#")
+        if len(header) < 4 or header[1] != "mdl":
+            raise ValueError(f"不是 Wapiti 模型檔: {path}")
+        if int(header[2]) != 2:
+            raise ValueError(f"僅支援 CRF 模型 (type 2)，實際為 {header[2]}")
+
+        npats = int(lines[1].split("#")[2].split("/")[0])
+        pos = 2
+        patterns = []
+        for _ in range(npats):
+            pattern, pos = _read_counted(lines, pos)
+            patterns.append(pattern)
+
+        quarks = []
+        for _ in range(2):
+            count = int(lines[pos].split("#")[2])
+            pos += 1
+            items = []
+            for _ in range(count):
+                item, pos = _read_counted(lines, pos)
+                items.append(item)
+            quarks.append(items)
+        labels, observations = quarks
+
+        Y = len(labels)
+        size = sum(
+            (Y if o[:1] != "b" else 0) + (Y * Y if o[:1] in "b*" else 0)
+            for o in observations
+        )
+        weights = np.zeros(size)
+        for line in lines[pos:]:
+            if "=" not in line:
+                continue
+            idx, value = line.split("=", 1)
+            value = value.strip()
+            weights[int(idx)] = float.fromhex(value) if "0x" in value.lower() else float(value)
+        return cls(patterns, labels, observations, weights)
+
+    # ========== 2. 特徵 → 觀測編號 ==========
+    def observe(self, rows):
+        """
+        rows: 每個 token 一列的特徵欄位 (第 0 欄為 token 本身)。
+        回傳每個位置命中的觀測編號列表 (模型中不存在的觀測字串直接略過)。
+        """
+        lookup = self.observations.get
+        seq_obs = []
+        for t in range(len(rows)):
+            ids = []
+            for pattern in self.patterns:
+                o = lookup(pattern.apply(rows, t))
+                if o is not None:
+                    ids.append(o)
+            seq_obs.append(ids)
+        return seq_obs
+
+    # ========== 3. 批次 Viterbi ==========
+    def decode(self, batch_obs):
+        """
+        batch_obs: 多個序列的觀測編號 (observe 的輸出)。
+        所有序列補齊到相同長度後一次計算分數與 Viterbi，回傳每個序列的標籤索引。
+        """
+        N = len(batch_obs)
+        if N == 0:
+            return []
+        lengths = np.array([len(s) for s in batch_obs])
+        T, Y = max(int(lengths.max()), 1), len(self.labels)
+
+        n_idx, t_idx, o_idx = [], [], []
+        for n, seq in enumerate(batch_obs):
+            for t, ids in enumerate(seq):
+                n_idx.extend([n] * len(ids))
+                t_idx.extend([t] * len(ids))
+                o_idx.extend(ids)
+        n_idx, t_idx, o_idx = np.array(n_idx, dtype=int), np.array(t_idx, dtype=int), np.array(o_idx, dtype=int)
+
+        # 每個位置的 unigram 分數 (N, T, Y) 與 bigram 分數 (N, T, Y, Y)
+        uni = np.zeros((N, T, Y))
+        np.add.at(uni, (n_idx, t_idx), self.unigram[o_idx])
+        bi = np.zeros((N, T, Y, Y))
+        mask = self.has_bigram[o_idx] & (t_idx > 0)
+        np.add.at(bi, (n_idx[mask], t_idx[mask]), self.bigram[o_idx[mask]])
+
+        score = uni[:, 0, :]
+        back = np.zeros((N, T, Y), dtype=int)
+        for t in range(1, T):
+            cand = score[:, :, None] + bi[:, t] + uni[:, t, None, :]
+            best_prev = cand.argmax(axis=1)     # 同分時取編號最小者 (與 Wapiti 相同)
+            active = (t < lengths)[:, None]
+            back[:, t] = best_prev
+            score = np.where(active, np.take_along_axis(cand, best_prev[:, None, :], axis=1)[:, 0, :], score)
+
+        paths = []
+        for n in range(N):
+            L = int(lengths[n])
+            if L == 0:
+                paths.append([])
+                continue
+            y = int(score[n].argmax())
+            path = [y]
+            for t in range(L - 1, 0, -1):
+                y = int(back[n, t, y])
+                path.append(y)
+            paths.append(path[::-1])
+        return paths
+
+
+# ========== 4. AnyStyle 特徵 (對應 AnyStyle::Parser 的 features 清單) ==========
+# 欄位順序：token、canonical、category(首/尾)、prefix 1/2、suffix 1/2、caps、number、
+# dictionary(name/place/publisher/journal)、keyword、position、punctuation、brackets、terminal、locator
+
+KEYWORDS = [
+    ("and", re.compile(r'^(and|&|und|et|y)$', re.I)),
+    ("in", re.compile(r'^(in|aus|dans)$', re.I)),
+    ("editor", re.compile(r'^(ed|eds|editor|editors|edited|hg|hrsg|herausgegeben)$', re.I)),
+    ("translator", re.compile(r'^(trans|transl|translated|translator|translators|übers)$', re.I)),
+    ("volume", re.compile(r'^(vol|vols|volume|volumes|bd|band|jg|jahrgang)$', re.I)),
+    ("number", re.compile(r'^(no|nos|nr|number|numbers|issue|heft)$', re.I)),
+    ("page", re.compile(r'^(p|pp|page|pages|s|seite|seiten)$', re.I)),
+    ("edition", re.compile(r'^(edn|edition|aufl|auflage)$', re.I)),
+    ("date", re.compile(
+        r'^(jan|january|feb|february|mar|march|apr|april|may|jun|june|jul|july|aug|august|'
+        r'sep|sept|september|oct|october|nov|november|dec|december|spring|summer|fall|autumn|winter)$', re.I)),
+    ("thesis", re.compile(r'^(phd|thesis|dissertation|diss|master|masters)$', re.I)),
+    ("accessed", re.compile(r'^(retrieved|accessed|available|abgerufen|zugegriffen)$', re.I)),
+    ("roman", re.compile(r'^[IVXLCDM]+$')),
+]
+
+
+def _category(ch):
+    cat = unicodedata.category(ch)
+    if cat in ("Lu", "Ll", "Pc", "Pd", "Ps", "Pe", "Pi", "Pf"):
+        return cat
+    if cat == "Po":
+        return "P"
+    return cat[0] if cat[0] in "LMNSZC" else "none"
+
+
+def _is_cat(ch, prefix):
+    return unicodedata.category(ch).startswith(prefix)
+
+
+def scrub(token):
+    # 只保留字母與數字 (對應 AnyStyle 的 alpha 參數)
+    return "".join(ch for ch in token if ch.isalpha() or ch.isdecimal())
+
+
+def _caps(alpha):
+    if not alpha:
+        return "other"
+    first = alpha[0]
+    if len(alpha) == 1 and first.isupper():
+        return "single"
+    if first.isupper() and alpha[1:2].islower():
+        return "initial"
+    if all(c.isupper() for c in alpha):
+        return "caps"
+    if all(c.islower() for c in alpha):
+        return "lower"
+    return "other"
+
+
+YEAR_PATTERN = re.compile(r'^\(?(1[5-9]|20)\d\d[a-z]?\)?[.,;:]?$')
+ORDINAL_PATTERN = re.compile(r'^\d+(st|nd|rd|th|d)\.?$', re.I)
+ROMAN_PATTERN = re.compile(r'^[IVXLCDM]+[.,]?$')
+RANGE_PATTERN = re.compile(r'\d+[-–—‐−－]+\d+')
+IDNUM_PATTERN = re.compile(r'\d[^\W\d_]|[^\W\d_]\d')
+
+
+def _number(token):
+    if YEAR_PATTERN.match(token): return "year"
+    if RANGE_PATTERN.search(token): return "range"
+    if ORDINAL_PATTERN.match(token): return "ordinal"
+    if ROMAN_PATTERN.match(token): return "roman"
+    if IDNUM_PATTERN.search(token): return "idnum"
+    if re.fullmatch(r'\d', token): return "single"
+    if re.fullmatch(r'\d\d', token): return "double"
+    if re.fullmatch(r'\d\d\d', token): return "triple"
+    if any(c.isdecimal() for c in token): return "numeric"
+    return "none"
+
+
+def _keyword(alpha):
+    for name, pattern in KEYWORDS:
+        if pattern.match(alpha):
+            return name
+    return "none"
+
+
+def _round_half_away(x):
+    # Ruby 的 Float#round (C round)：.5 一律進位；Python 的 round() 為銀行家捨入，結果不同
+    whole = math.floor(x)
+    return whole + (1 if x - whole >= 0.5 else 0)
+
+
+def _position(idx, length, precision=10):
+    if idx == 0: return "first"
+    if idx == length - 1: return "last"
+    return str(_round_half_away(idx / length * precision))
+
+
+def _punctuation(token):
+    if token.endswith(":"): return "colon"
+    if token.endswith("."): return "period"
+    if "&" in token: return "amp"
+    if any(_is_cat(c, "Pd") for c in token): return "hyphen"
+    if any(_is_cat(c, "P") for c in token): return "other"
+    return "none"
+
+
+def _brackets(token):
+    opens, closes = _is_cat(token[0], "Ps"), _is_cat(token[-1], "Pe")
+    if opens and closes: return "parens"
+    if opens: return "opening-paren"
+    if closes: return "closing-paren"
+    if any(_is_cat(c, "Ps") or _is_cat(c, "Pe") for c in token): return "other"
+    return "none"
+
+
+TERMINAL_STRONG = re.compile(r'[.)\]]["\'”’]?$')
+TERMINAL_MODERATE = re.compile(r'[:;]["\'”’]?$')
+TERMINAL_WEAK = re.compile(r'[!?,"\'”’\-–—‐−－]$')
+
+
+def _terminal(token):
+    if TERMINAL_STRONG.search(token): return "strong"
+    if TERMINAL_MODERATE.search(token): return "moderate"
+    if TERMINAL_WEAK.search(token): return "weak"
+    return "none"
+
+
+LOCATOR_PATTERN = re.compile(r'^(https?://|www\.|doi:|10\.\d{4,9}/|urn:|isbn|issn|arxiv:)', re.I)
+
+
+def token_features(tokens, dictionary=None):
+    """
+    對一個已切好的 token 序列產生 AnyStyle 的 20 欄特徵。
+    dictionary: load_dictionary 的結果 {小寫字詞: {'name', 'place', 'publisher', 'journal'} 的子集}；
+    未提供時字典特徵全部為 F (與 CLI 的結果會有差異)。
+    """
+    dictionary = dictionary or {}
+    rows = []
+    n = len(tokens)
+    for idx, tok in enumerate(tokens):
+        alpha = scrub(tok)
+        canonical = alpha.lower() or "BLANK"
+        tags = dictionary.get(alpha.lower(), ())
+        rows.append([
+            tok,
+            canonical,
+            _category(tok[0]),
+            _category(tok[-1]),
+            tok[:1],
+            tok[:2],
+            tok[-1:],
+            tok[-2:],
+            _caps(alpha),
+            _number(tok),
+            "T" if "name" in tags else "F",
+            "T" if "place" in tags else "F",
+            "T" if "publisher" in tags else "F",
+            "T" if "journal" in tags else "F",
+            _keyword(alpha),
+            _position(idx, n),
+            _punctuation(tok),
+            _brackets(tok),
+            _terminal(tok),
+            "T" if LOCATOR_PATTERN.match(tok) else "F",
+        ])
+    return rows
+
+
+def tokenize(line):
+    # AnyStyle Parser 以空白切 token
+    return line.split()
+
+
+# ========== 5. AnyStyle 字典 (Nme/Loc/Pub/Jnl 特徵) ==========
+# anystyle-data 的 dict.txt.gz：以 '#' 開頭的分類標題 (例如 '## surname')，之後每行一個字詞，
+# 字詞後可接出現機率。另支援自行匯出的 '字詞<TAB>name,place' 格式。
+DICTIONARY_HEADINGS = [
+    ("name", re.compile(r'male|female|surname|first|last|name', re.I)),
+    ("place", re.compile(r'place|city|cities|country|countries|location|state', re.I)),
+    ("publisher", re.compile(r'publisher', re.I)),
+    ("journal", re.compile(r'journal', re.I)),
+]
+DICTIONARY_TAGS = {tag for tag, _ in DICTIONARY_HEADINGS}
+DICTIONARY_ENTRY = re.compile(r'^(.*?)(?:\s+\d+(?:\.\d+)?(?:e-?\d+)?)?\s*$')
+
+
+def load_dictionary(path):
+    """
+    讀取 AnyStyle 字典，回傳 {小寫字詞: {標籤}}。
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    dictionary = {}
+    mode = None
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("#"):
+                mode = next((tag for tag, pattern in DICTIONARY_HEADINGS if pattern.search(line)), None)
+                continue
+            if "\t" in line:
+                word, tags = line.split("\t", 1)
+                tags = {t.strip() for t in tags.split(",")} & DICTIONARY_TAGS
+            else:
+                word, tags = DICTIONARY_ENTRY.match(line).group(1), {mode} if mode else set()
+            if word and tags:
+                dictionary.setdefault(word.lower(), set()).update(tags)
+    return dictionary
+
+
+def find_anystyle_dictionary():
+    """
+    在已安裝的 anystyle-data gem 中尋找 dict.txt.gz，找不到時回傳 None。
+    """
+    try:
+        result = subprocess.run(
+            ["ruby", "-e", "print Gem::Specification.find_by_name('anystyle-data').gem_dir"],
+            capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    for name in ("dict.txt.gz", "dict.txt"):
+        path = os.path.join(result.stdout.strip(), "lib", "anystyle", "data", name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+# ========== 6. 對外介面 ==========
+class CRFParser:
+    """
+    以 Wapiti 模型在行程內解析參考文獻。
+    label_batch 回傳每行的 [(token, 標籤), ...]；parse_batch 依連續標籤合併成欄位。
+    """
+
+    def __init__(self, model_path, dictionary=None):
+        """
+        dictionary: 字典檔路徑或 load_dictionary 的結果；None 時字典特徵全部為 F。
+        """
+        self.model = WapitiModel.load(model_path)
+        self.dictionary = load_dictionary(dictionary) if isinstance(dictionary, str) else dictionary
+
+    def label_batch(self, lines):
+        token_lists = [tokenize(line) for line in lines]
+        batch_obs = [self.model.observe(token_features(toks, self.dictionary)) for toks in token_lists]
+        paths = self.model.decode(batch_obs)
+        labels = self.model.labels
+        return [[(tok, labels[y]) for tok, y in zip(toks, path)] for toks, path in zip(token_lists, paths)]
+
+    def parse_batch(self, lines):
+        """
+        回傳未經整理的標籤片段：每個標籤對應一個字串列表 (整理見 parsers.normalize_native_item)。
+        """
+        results = []
+        for line, labeled in zip(lines, self.label_batch(lines)):
+            item = {}
+            prev, buf = None, []
+            for tok, label in labeled + [(None, None)]:
+                if label != prev and buf:
+                    item.setdefault(prev, []).append(" ".join(buf))
+                    buf = []
+                if tok is not None:
+                    buf.append(tok)
+                prev = label
+            item["text"] = line
+            results.append(item)
+        return results
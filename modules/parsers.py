@@ -6,35 +6,135 @@ import streamlit as st
 import tempfile
 import os
 
-def parse_references_with_anystyle(raw_text):
-    if not raw_text or not raw_text.strip():
-        return [], []
+# 中日韓統一表意文字 (預先編譯，供各模組共用)
+CJK_PATTERN = re.compile('[\u4e00-\u9fff]')
+
+# 中文文獻改用行程內的 CRF 引擎 (modules/crf.py) 解析，不啟動 AnyStyle 子行程。
+# 與 CLI 的標籤一致性請先以 benchmarks/bench_crf.py 確認後再開啟
+NATIVE_CRF_FOR_CJK = False
+CUSTOM_MODEL_PATH = "custom.mod"
+AUTHOR_SPLIT_PATTERN = re.compile(r'\s*[、，,;；&]\s*|\s+(?:and|與|和|及)\s+')
+# 比照 AnyStyle 的 normalizer：去除欄位前後的標點與括號、日期只取年份
+FIELD_STRIP_CHARS = ' .,:;。，：；、()（）[]「」『』"'
+YEAR_PATTERN = re.compile(r'(1[89]|20)\d{2}')
+# 出版者為學校 (且非大學出版社) 或原文提及學位論文者視為 thesis
+THESIS_PATTERN = re.compile(r'論文|thesis|dissertation', re.I)
+SCHOOL_PATTERN = re.compile(r'大學|學院|universit|college|institute', re.I)
+PRESS_PATTERN = re.compile(r'出版|press', re.I)
+
+@st.cache_resource(show_spinner=False)
+def load_crf_parser(model_path=CUSTOM_MODEL_PATH):
+    """
+    載入 custom.mod 與 AnyStyle 字典 (每個行程只載入一次)。
+    """
+    from .crf import CRFParser, find_anystyle_dictionary
+    return CRFParser(model_path, find_anystyle_dictionary())
+
+def normalize_native_item(item):
+    """
+    整理 CRF 的原始標籤片段：欄位去除標點、日期取年份、作者拆成姓名、補上文獻類型。
+    """
+    for key, values in list(item.items()):
+        if key in ('text', 'author'):
+            continue
+        values = [v.strip(FIELD_STRIP_CHARS) for v in values]
+        if key == 'date':
+            values = [m.group(0) for m in map(YEAR_PATTERN.search, values) if m]
+        values = [v for v in values if v]
+        if values:
+            item[key] = values
+        else:
+            del item[key]
+
+    if 'author' in item:
+        names = [n.strip(FIELD_STRIP_CHARS) for seg in item['author'] for n in AUTHOR_SPLIT_PATTERN.split(seg)]
+        authors = []
+        for n in filter(None, names):
+            # 中文姓名不拆姓與名；西文姓名以最後一個字為姓
+            if CJK_PATTERN.search(n) or ' ' not in n:
+                authors.append({'literal': n} if CJK_PATTERN.search(n) else {'family': n})
+            else:
+                given, family = n.rsplit(' ', 1)
+                authors.append({'family': family, 'given': given})
+        item['author'] = authors
+        item['authors'] = "; ".join(format_author(a) for a in authors)
+
+    if 'container-title' in item or 'journal' in item:
+        item['type'] = 'article-journal'
+    elif 'publisher' in item:
+        publisher = " ".join(item['publisher'])
+        is_school = SCHOOL_PATTERN.search(publisher) and not PRESS_PATTERN.search(publisher)
+        item['type'] = 'thesis' if is_school or THESIS_PATTERN.search(item['text']) else 'book'
+    return item
 
+def format_author(a):
+    return a.get('literal') or f"{a.get('family', '')} {a.get('given', '')}".strip()
+
+def parse_cjk_references_natively(lines):
+    """
+    以行程內 CRF 批次解析，欄位結構與 CLI 的 JSON 相同 (author、title、date、type、text…)。
+    欄位值的整理為近似 AnyStyle normalizer 的簡化版本，尚未與 CLI 逐筆比對 (見 benchmarks/crf_parity.txt)。
+    """
+    return [normalize_native_item(item) for item in load_crf_parser().parse_batch(lines)]
+
+@st.cache_resource(show_spinner=False)
+def find_anystyle_command():
+    """
+    偵測可用的 AnyStyle 指令（每個行程只偵測一次，結果快取）。
+    找不到時回傳 None。
+    """
     # 🕵️ 雲端指令偵測邏輯
     # 嘗試所有可能的指令組合
-    found_cmd = None
     test_cmds = [["anystyle", "--version"], ["ruby", "-S", "anystyle", "--version"]]
     
     for cmd in test_cmds:
         try:
             subprocess.run(cmd, capture_output=True, check=True)
-            found_cmd = cmd[:-1] # 移除 --version
-            break
+            return cmd[:-1] # 移除 --version
         except:
             continue
+    return None
 
-    if not found_cmd:
-        st.error("❌ 無法啟動解析引擎 (AnyStyle)。請嘗試 Manage App -> Reboot。")
+def parse_references_with_anystyle(raw_text):
+    if not raw_text or not raw_text.strip():
         return [], []
 
     lines = [line.strip() for line in raw_text.split('\n') if line.strip()]
+
+    # 中文文獻一次批次解析，其餘仍交給 AnyStyle CLI
+    native = {}
+    if NATIVE_CRF_FOR_CJK and os.path.exists(CUSTOM_MODEL_PATH):
+        cjk_idx = [i for i, line in enumerate(lines) if CJK_PATTERN.search(line)]
+        try:
+            native = dict(zip(cjk_idx, parse_cjk_references_natively([lines[i] for i in cjk_idx])))
+        except Exception as e:
+            st.warning(f"CRF 引擎解析失敗，改用 AnyStyle: {str(e)}")
+
+    found_cmd = None
+    if len(native) < len(lines):
+        found_cmd = find_anystyle_command()
+        if not found_cmd:
+            # 可能是剛安裝完成，清除快取後再偵測一次
+            find_anystyle_command.clear()
+            found_cmd = find_anystyle_command()
+
+        if not found_cmd:
+            st.error("❌ 無法啟動解析引擎 (AnyStyle)。請嘗試 Manage App -> Reboot。")
+            return [], []
+
     structured_refs = []
     raw_texts = []
     
     progress_bar = st.progress(0)
     
     for i, line in enumerate(lines):
-        has_chinese = bool(re.search(r'[\u4e00-\u9fff]', line))
+        if i in native:
+            structured_refs.append(native[i])
+            raw_texts.append(line)
+            progress_bar.progress((i + 1) / len(lines))
+            continue
+
+        has_chinese = bool(CJK_PATTERN.search(line))
         
         with tempfile.NamedTemporaryFile(mode="w", suffix=".txt", delete=False, encoding="utf-8") as tmp:
             tmp.write(line)
@@ -42,8 +142,8 @@ def parse_references_with_anystyle(raw_text):
 
         # 組合解析指令
         command = found_cmd + ["-f", "json", "parse"]
-        if has_chinese and os.path.exists("custom.mod"):
-            command += ["-P", "custom.mod"]
+        if has_chinese and os.path.exists(CUSTOM_MODEL_PATH):
+            command += ["-P", CUSTOM_MODEL_PATH]
         command.append(tmp_path)
 
         try:
@@ -57,10 +157,7 @@ def parse_references_with_anystyle(raw_text):
                 for item in data:
                     # 簡化作者格式
                     if 'author' in item:
-                        authors = []
-                        for a in item['author']:
-                            authors.append(f"{a.get('family', '')} {a.get('given', '')}".strip())
-                        item['authors'] = "; ".join(authors)
+                        item['authors'] = "; ".join(format_author(a) for a in item['author'])
                     
                     if 'text' not in item: item['text'] = line
                     structured_refs.append(item)
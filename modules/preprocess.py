@@ -0,0 +1,161 @@
+# modules/preprocess.py
+# 前處理：清理 AnyStyle 的解析結果，產出可直接交給查核執行緒的精簡紀錄 (QueryRecord)。
+# 批次版 (preprocess_references) 以欄為單位一次處理整份清單；逐筆版保留作為對照基準。
+
+import ast
+import re
+from collections import namedtuple
+
+from .parsers import CJK_PATTERN
+
+STRIP_CHARS = ' ,.;)]}>'
+ABBR_TITLE_PATTERN = re.compile(r'^([A-Z0-9\-\.\s]{2,12}:\s*.+?)(?=\s*[,\[]|\s*Available|\s*\(|\bhttps?://|\.|$)')
+DOI_IN_URL_PATTERN = re.compile(r'(10\.\d{4,9}/[-._;()/:a-zA-Z0-9]+)')
+
+CLEAN_FIELDS = ['doi', 'url', 'title', 'date']
+# 交給查核執行緒的精簡紀錄 (tuple，無逐筆 dict 負擔)
+QueryRecord = namedtuple(
+    "QueryRecord", ["title", "text", "search_query", "doi", "url", "first_author", "has_cjk", "type"]
+)
+TITLE_FALLBACK_FIELDS = ['publisher', 'container-title', 'journal']
+
+
+# ========== 逐筆版 (原始邏輯) ==========
+def format_name_field(data):
+    if not data: return None
+    try:
+        if isinstance(data, str):
+            if not (data.startswith('[') or data.startswith('{')): return data
+            data = ast.literal_eval(data)
+        names_list = []
+        items = [data] if isinstance(data, dict) else data
+        for item in items:
+            if isinstance(item, dict):
+                parts = [p for p in [item.get('family'), item.get('given')] if p]
+                names_list.append(", ".join(parts))
+            else: names_list.append(str(item))
+        return "; ".join(names_list)
+    except: return str(data)
+
+def refine_parsed_data(parsed_item):
+    item = parsed_item.copy()
+    raw_text = item.get('text', '').strip()
+    for key in CLEAN_FIELDS:
+        val = item.get(key)
+        if val and isinstance(val, str): item[key] = val.strip(STRIP_CHARS)
+        elif val is not None: item[key] = str(val)
+
+    title = item.get('title', '')
+    if not title or len(title) < 10:
+        abbr_match = ABBR_TITLE_PATTERN.search(raw_text)
+        if abbr_match: item['title'] = abbr_match.group(1).strip()
+        else:
+            for k in TITLE_FALLBACK_FIELDS:
+                if item.get(k) and len(str(item[k])) > 15:
+                    item['title'] = str(item[k]).strip()
+                    break
+
+    current_url = item.get('url')
+    if current_url and isinstance(current_url, str):
+        doi_match = DOI_IN_URL_PATTERN.search(current_url)
+        if doi_match: item['doi'] = doi_match.group(1).strip('.')
+
+    if item.get('authors'): item['authors'] = format_name_field(item['authors'])
+    return item
+
+def to_query_record(ref):
+    """
+    由 refine_parsed_data 的結果取出查核需要的欄位。
+    """
+    title, text = ref.get('title') or '', ref.get('text', '')
+    search_query = title if (title and len(title) > 8) else text[:120]
+    return QueryRecord(
+        title=title,
+        text=text,
+        search_query=search_query,
+        doi=ref.get('doi') or None,
+        url=ref.get('url') or None,
+        first_author=ref['authors'].split(';')[0].split(',')[0].strip() if ref.get('authors') else "",
+        has_cjk=bool(CJK_PATTERN.search(search_query)),
+        type=ref.get('type') or None,
+    )
+
+def preprocess_reference(parsed_item):
+    return to_query_record(refine_parsed_data(parsed_item))
+
+
+# ========== 批次版 (欄式) ==========
+# 每個欄位取成一個 list，逐欄以 list 運算清理，不複製每筆 dict。
+# 正規式前先以 C 層字串方法 (isascii、in) 排除不可能符合的值，只對少數候選者執行。
+def _clean_column(values):
+    """
+    與 refine_parsed_data 相同：字串去除前後標點 (空字串不變)，其他非 None 值以 str() 轉換。
+    """
+    return [v.strip(STRIP_CHARS) if type(v) is str else (None if v is None else str(v)) for v in values]
+
+def _fallback_title(parsed_item, text):
+    """
+    標題過短時的補救 (縮寫型標題 → publisher / container-title / journal)，找不到時回傳 None。
+    """
+    raw_text = text.strip()
+    # 縮寫型標題必含 ':'，不含者略過正規式
+    abbr_match = ABBR_TITLE_PATTERN.search(raw_text) if ':' in raw_text else None
+    if abbr_match: return abbr_match.group(1).strip()
+    for k in TITLE_FALLBACK_FIELDS:
+        val = parsed_item.get(k)
+        if val and len(str(val)) > 15:
+            return str(val).strip()
+    return None
+
+def _first_authors(values):
+    """
+    作者欄攤平後取第一位作者；一般字串直接切割，只有序列化的 list/dict 才解析 (相同字串只解析一次)。
+    """
+    memo = {}
+    first_authors = []
+    for val in values:
+        if not val:
+            first_authors.append("")
+            continue
+        if type(val) is str:
+            if val[0] in '[{':
+                if val not in memo: memo[val] = format_name_field(val)
+                val = memo[val]
+        else:
+            val = format_name_field(val)
+        first_authors.append(val.split(';')[0].split(',')[0].strip())
+    return first_authors
+
+def preprocess_references(struct_list):
+    """
+    批次版前處理，輸出與 [preprocess_reference(r) for r in struct_list] 相同。
+    """
+    text = [r.get('text', '') for r in struct_list]
+    title = _clean_column([r.get('title', '') for r in struct_list])
+    url = _clean_column([r.get('url') for r in struct_list])
+    doi = _clean_column([r.get('doi') for r in struct_list])
+
+    # 1. 標題過短時的補救
+    for i, t in enumerate(title):
+        if not t or len(t) < 10:
+            new_title = _fallback_title(struct_list[i], text[i])
+            if new_title is not None: title[i] = new_title
+
+    # 2. 從網址中擷取 DOI (DOI 必含 "10.")
+    for i, u in enumerate(url):
+        if u and '10.' in u:
+            doi_match = DOI_IN_URL_PATTERN.search(u)
+            if doi_match: doi[i] = doi_match.group(1).strip('.')
+
+    # 3. 查詢字串與文字系統偵測 (純 ASCII 必不含中日韓文字)
+    title = [t or '' for t in title]
+    search_query = [t if len(t) > 8 else x[:120] for t, x in zip(title, text)]
+    has_cjk = [not q.isascii() and CJK_PATTERN.search(q) is not None for q in search_query]
+
+    columns = [
+        title, text, search_query,
+        [d or None for d in doi], [u or None for u in url],
+        _first_authors([r.get('authors') for r in struct_list]),
+        has_cjk, [r.get('type') or None for r in struct_list],
+    ]
+    return list(map(QueryRecord._make, zip(*columns)))
@@ -0,0 +1,234 @@
+# modules/quota.py
+# 付費 API (Scopus、SerpAPI) 的用量控制：
+#   1. 同步查詢合併 (single-flight)：相同來源、相同參數的查詢同時進行時只發出一次網路呼叫
+#   2. 用量預算：每次查核工作與每日的呼叫上限，Google Scholar 備援查詢超出預算時延後或略過
+
+import json
+import os
+import threading
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date
+
+# --- 全域設定 ---
+PAID_USAGE_PATH = "paid_usage.json"    # 每日累計用量 (跨使用者)
+DAILY_LIMITS = {"Scopus": 2000, "Google Scholar": 250}
+JOB_LIMITS = {"Scopus": 200, "Google Scholar": 60}
+# 主要查核進行中時，保留給其他文獻主要查詢的 Google Scholar 次數；低於此數的備援查詢延到最後
+FALLBACK_RESERVE = 10
+
+BUDGET_EXHAUSTED = "Budget exhausted"
+
+
+class SingleFlight:
+    """
+    進行中的查詢表：第一個呼叫者 (leader) 實際發出請求，其餘相同 key 的呼叫者等待並共用結果。
+    只合併「同時」進行的查詢，完成後即移除，不做結果快取。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.counters = Counter()   # (來源, "calls" / "shared")
+
+    def do(self, source, key, fn, admit=None):
+        """
+        回傳 (結果, 狀態)，狀態為 "called" (實際發出請求)、"shared" (共用他人結果) 或 "denied"。
+        admit: 成為 leader 前的許可檢查 (例如預算)；不通過時不發出請求，結果為 None。
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            shared = future is not None
+            if not shared:
+                if admit is not None and not admit():
+                    return None, "denied"
+                future = self._inflight[key] = Future()
+            self.counters[(source, "shared" if shared else "calls")] += 1
+        if shared:
+            return future.result(), "shared"
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        return result, "called"
+
+
+FLIGHTS = SingleFlight()
+
+
+class PaidUsage:
+    """
+    每日用量 (跨工作、跨使用者共用)，日期變更時自動歸零。
+    檔案結構：{"date": "YYYY-MM-DD", "calls": {來源: 次數}}
+    """
+
+    def __init__(self, path=PAID_USAGE_PATH, daily_limits=DAILY_LIMITS):
+        self.path = path
+        self.daily_limits = daily_limits
+        self.day = date.today().isoformat()
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("date") == self.day:
+                self.calls = Counter(data.get("calls", {}))
+        except (OSError, ValueError):
+            pass
+
+    def save(self):
+        with self._lock:
+            data = json.dumps({"date": self.day, "calls": dict(self.calls)}, ensure_ascii=False)
+        if not self.path:
+            return
+        try:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def _rollover(self):
+        today = date.today().isoformat()
+        if today != self.day:
+            self.day, self.calls = today, Counter()
+
+    def remaining(self, source):
+        with self._lock:
+            self._rollover()
+            limit = self.daily_limits.get(source)
+            return float("inf") if limit is None else limit - self.calls[source]
+
+    def consume(self, source):
+        with self._lock:
+            self._rollover()
+            limit = self.daily_limits.get(source)
+            if limit is not None and self.calls[source] >= limit:
+                return False
+            self.calls[source] += 1
+            return True
+
+    def new_job(self, job_limits=JOB_LIMITS, fallback_reserve=FALLBACK_RESERVE):
+        return JobBudget(self, job_limits, fallback_reserve)
+
+
+class JobBudget:
+    """
+    單次查核工作的預算，同時受每日上限約束。
+    備援查詢 (Google Scholar 以原文搜尋) 在預算吃緊時放入延後佇列，
+    待所有文獻的主要查詢完成後以剩餘預算執行，仍不足者略過。
+    """
+
+    def __init__(self, usage, job_limits=JOB_LIMITS, fallback_reserve=FALLBACK_RESERVE):
+        self.usage = usage
+        self.job_limits = job_limits
+        self.fallback_reserve = fallback_reserve
+        self.used = Counter()
+        self.counters = Counter()   # saved / denied / deferred / skipped
+        self._deferred = []
+        self._lock = threading.Lock()
+
+    def remaining(self, source):
+        with self._lock:
+            limit = self.job_limits.get(source)
+            job_left = float("inf") if limit is None else limit - self.used[source]
+        return min(job_left, self.usage.remaining(source))
+
+    def available(self, source):
+        return self.remaining(source) > 0
+
+    def acquire(self, source):
+        """
+        扣除一次呼叫額度；工作或每日額度用盡時回傳 False。
+        """
+        with self._lock:
+            limit = self.job_limits.get(source)
+            if limit is not None and self.used[source] >= limit:
+                self.counters["denied"] += 1
+                return False
+            if not self.usage.consume(source):
+                self.counters["denied"] += 1
+                return False
+            self.used[source] += 1
+            return True
+
+    def admits_fallback(self, source):
+        return self.remaining(source) > self.fallback_reserve
+
+    def record_shared(self):
+        with self._lock:
+            self.counters["saved"] += 1
+
+    def skip(self):
+        """
+        記錄一筆因額度用盡而放棄的備援查詢 (工作期間額度不會回復，不必延後)。
+        """
+        with self._lock:
+            self.counters["skipped"] += 1
+
+    # ========== 延後佇列 ==========
+    def defer(self, key, source, fn):
+        with self._lock:
+            self._deferred.append((key, source, fn))
+            self.counters["deferred"] += 1
+
+    def drain(self, max_workers=5):
+        """
+        依加入順序以剩餘預算執行延後的查詢，回傳 {key: 結果}；額度不足者略過。
+        fn 回傳 (url, 狀態)，狀態為 BUDGET_EXHAUSTED 時視為略過。
+        """
+        with self._lock:
+            pending, self._deferred = self._deferred, []
+        results = {}
+        if not pending:
+            return results
+
+        runnable = []
+        for key, source, fn in pending:
+            if self.available(source):
+                runnable.append((key, fn))
+            else:
+                self.counters["skipped"] += 1
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {key: executor.submit(fn) for key, fn in runnable}
+            for key, future in futures.items():
+                try:
+                    url, status = future.result()
+                except Exception:
+                    continue
+                if status == BUDGET_EXHAUSTED:
+                    self.counters["skipped"] += 1
+                else:
+                    results[key] = url
+        return results
+
+    def summary(self):
+        with self._lock:
+            return {"used": dict(self.used), **{k: self.counters[k] for k in ("saved", "denied", "deferred", "skipped")}}
+
+
+def paid_call(source, key, fn, budget=None):
+    """
+    付費 API 的共用入口：合併同時進行的相同查詢，並在實際發出請求前扣除預算。
+    預算不足時回傳 (None, BUDGET_EXHAUSTED)。
+    """
+    admit = (lambda: budget.acquire(source)) if budget is not None else None
+    result, state = FLIGHTS.do(source, (source,) + tuple(key), fn, admit)
+    if state == "denied":
+        return None, BUDGET_EXHAUSTED
+    if state == "shared" and budget is not None:
+        budget.record_shared()
+    return result
@@ -0,0 +1,85 @@
+# modules/report.py
+# 查核結果的欄式 (columnar) 報表：一次建表、向量化分類/篩選/計數、CSV 只產生一次
+
+import pandas as pd
+import numpy as np
+
+# 狀態分類 (與舊版逐筆判斷 found_at_step 子字串的邏輯一致)
+STATUS_VERIFIED = "verified"        # 資料庫驗證
+STATUS_WEBSITE = "website"          # 網站有效來源
+STATUS_LINK_FAILED = "link_failed"  # 網站 (連線失敗)
+STATUS_NOT_FOUND = "not_found"      # 未找到結果
+STATUS_ORDER = [STATUS_VERIFIED, STATUS_WEBSITE, STATUS_LINK_FAILED, STATUS_NOT_FOUND]
+
+STATUS_ICONS = {
+    STATUS_VERIFIED: "✅",
+    STATUS_WEBSITE: "🌐",
+    STATUS_LINK_FAILED: "⚠️",
+    STATUS_NOT_FOUND: "❌",
+}
+
+RESULT_COLUMNS = ["id", "title", "text", "found_at_step", "source_name", "source_link", "suggestion"]
+
+
+def build_results_table(results):
+    """
+    將 check_single_task 的結果列表轉成一張精簡的 DataFrame。
+    不保留 parsed 字典，每筆只留畫面與匯出需要的欄位，並預先計算 status 類別。
+    """
+    rows = []
+    for r in results:
+        sources = r.get("sources") or {}
+        source_name, source_link = next(iter(sources.items()), (None, None))
+        rows.append((
+            r["id"], r.get("title") or "", r.get("text") or "", r.get("found_at_step"),
+            source_name, source_link, r.get("suggestion")
+        ))
+    # 以 object 欄位保留 None：pandas 3 推斷的 str 欄位會把缺值存成 nan (真值為 True)，畫面會顯示 nan
+    df = pd.DataFrame(rows, columns=RESULT_COLUMNS, dtype=object)
+    df["id"] = df["id"].astype(int)
+    df = df.sort_values("id", kind="stable").reset_index(drop=True)
+    df["status"] = classify_steps(df["found_at_step"])
+    return df
+
+
+def classify_steps(steps):
+    """
+    向量化判斷每筆的狀態類別，回傳 categorical Series。
+    """
+    step = steps.fillna("").astype(str)
+    status = np.select(
+        [step.eq(""), step.str.contains("Failed", regex=False), step.str.contains("6.", regex=False)],
+        [STATUS_NOT_FOUND, STATUS_LINK_FAILED, STATUS_WEBSITE],
+        default=STATUS_VERIFIED,
+    )
+    return pd.Categorical(status, categories=STATUS_ORDER)
+
+
+def count_by_status(df):
+    """
+    各狀態的筆數 (dict)，缺少的類別補 0。
+    """
+    return df["status"].value_counts().reindex(STATUS_ORDER, fill_value=0).to_dict()
+
+
+def filter_by_status(df, status=None):
+    """
+    status 為 None 時回傳全部，否則以布林遮罩篩選。
+    """
+    if status is None:
+        return df
+    return df[df["status"] == status]
+
+
+def export_csv(df):
+    """
+    產生下載用 CSV (utf-8-sig，Excel 可直接開啟)，欄位與舊版報表相同。
+    """
+    df_export = pd.DataFrame({
+        "ID": df["id"],
+        "狀態": df["found_at_step"].fillna("未找到"),
+        "抓取標題": df["title"],
+        "原始文獻內容": df["text"],
+        "驗證來源連結": df["source_link"].fillna("N/A"),
+    })
+    return df_export.to_csv(index=False).encode('utf-8-sig')
@@ -0,0 +1,260 @@
+# modules/scheduler.py
+# 自適應查詢順序：依「文獻類別」記錄各資料庫的命中率與延遲，動態決定查詢順序
+
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+# --- 全域設定 ---
+STATS_PATH = "source_stats.json"     # 累積統計 (命中/嘗試次數/延遲)
+RUNS_PATH = "source_runs.jsonl"      # 每筆文獻的查詢紀錄，供離線評估使用
+
+# 原本寫死的查詢順序，統計不足時以此為準
+DEFAULT_ORDER = ["Crossref", "Scopus", "OpenAlex", "Semantic Scholar", "Google Scholar"]
+PAID_SOURCES = {"Scopus", "Google Scholar"}
+# 每筆文獻最多呼叫幾次付費 API，Google Scholar 原文備援查詢也計入。
+# 預設 3 次即原本的最壞情況 (Scopus、Google Scholar、備援查詢)，兩把金鑰都設定時備援查詢照常執行
+MAX_PAID_CALLS_PER_REF = 3
+
+# 付費呼叫的期望次數上限 (每筆文獻)；None 表示不得高於原本固定順序在相同估計下的期望次數
+MAX_EXPECTED_PAID_CALLS = None
+# 付費來源的懲罰 (秒/次) 由小到大嘗試，取第一個滿足期望次數上限的排序
+PAID_PENALTIES = [0.0, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, float("inf")]
+
+# 貝氏平滑：類別樣本不足時向上一層 (較粗的類別) 借統計
+PRIOR_WEIGHT = 5.0
+DEFAULT_HIT_RATE = 0.3
+DEFAULT_LATENCY = 2.0
+
+
+def reference_class(record):
+    """
+    由前處理後的 QueryRecord 取出分類特徵：中日韓文字、DOI、文獻類型、網址網域。
+    回傳由粗到細的類別鍵列表，最後一個是最細的類別。
+    """
+    cjk = "cjk" if record.has_cjk else "latin"
+    has_doi = "doi" if record.doi else "nodoi"
+    ref_type = str(record.type or "unknown")
+    domain = "-"
+    url = record.url
+    if url and isinstance(url, str):
+        netloc = urlparse(url if "://" in url else "http://" + url).netloc.lower()
+        # 只取最後兩段網域 (例如 arxiv.org、ieee.org)，避免類別過度分散
+        domain = ".".join(netloc.split(":")[0].split(".")[-2:]) or "-"
+    return [
+        cjk,
+        f"{cjk}|{has_doi}",
+        f"{cjk}|{has_doi}|{ref_type}",
+        f"{cjk}|{has_doi}|{ref_type}|{domain}",
+    ]
+
+
+def expected_paid_calls(order, estimates):
+    """
+    依 estimates {來源: (命中率, 延遲)} 計算循序查詢時付費呼叫的期望次數 (命中即停止)。
+    """
+    reach, paid = 1.0, 0.0
+    for source in order:
+        if source in PAID_SOURCES:
+            paid += reach
+        reach *= 1 - estimates[source][0]
+    return paid
+
+
+class SourceScheduler:
+    """
+    執行緒安全的來源統計與排序器。
+    stats 結構：{類別鍵: {來源: [嘗試次數, 命中次數, 總延遲秒數]}}，空字串為全域統計。
+    """
+
+    def __init__(self, stats_path=STATS_PATH, runs_path=RUNS_PATH, max_paid_calls=MAX_PAID_CALLS_PER_REF,
+                 max_expected_paid=MAX_EXPECTED_PAID_CALLS):
+        self.stats_path = stats_path
+        self.runs_path = runs_path
+        self.max_paid_calls = max_paid_calls
+        self.max_expected_paid = max_expected_paid
+        self.stats = {}
+        self._pending_runs = []
+        self._lock = threading.Lock()
+        self.load()
+
+    # ========== 持久化 ==========
+    def load(self):
+        if not self.stats_path or not os.path.exists(self.stats_path):
+            return
+        try:
+            with open(self.stats_path, "r", encoding="utf-8") as f:
+                self.stats = json.load(f)
+        except (OSError, ValueError):
+            self.stats = {}
+
+    def save(self):
+        """
+        寫回統計檔並附加本次累積的查詢紀錄 (一次工作結束時呼叫)。
+        """
+        with self._lock:
+            stats = json.dumps(self.stats, ensure_ascii=False)
+            runs, self._pending_runs = self._pending_runs, []
+        try:
+            if self.stats_path:
+                tmp_path = self.stats_path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(stats)
+                os.replace(tmp_path, self.stats_path)
+            if self.runs_path and runs:
+                with open(self.runs_path, "a", encoding="utf-8") as f:
+                    for run in runs:
+                        f.write(json.dumps(run, ensure_ascii=False) + "\n")
+        except OSError:
+            pass
+
+    # ========== 估計與排序 ==========
+    def estimate(self, class_keys, source):
+        """
+        由全域 → 最細類別逐層平滑，回傳 (命中率, 平均延遲)。
+        """
+        p, c = DEFAULT_HIT_RATE, DEFAULT_LATENCY
+        for key in [""] + list(class_keys):
+            entry = self.stats.get(key, {}).get(source)
+            if not entry:
+                continue
+            attempts, hits, latency = entry
+            p = (hits + PRIOR_WEIGHT * p) / (attempts + PRIOR_WEIGHT)
+            c = (latency + PRIOR_WEIGHT * c) / (attempts + PRIOR_WEIGHT)
+        return p, c
+
+    def order(self, class_keys, sources):
+        """
+        在付費呼叫上限內使期望耗時最小的查詢順序：
+          1. 依 (延遲 + 懲罰 × 是否付費) / 命中率 由小到大排序 (循序查詢下期望成本最小的順序)
+          2. 懲罰由 0 起逐步加大，直到付費呼叫的期望次數不超過上限 (MAX_EXPECTED_PAID_CALLS，
+             預設為原本固定順序的期望次數)；懲罰為無限大時即「免費來源全部優先」
+          3. 付費來源的數量不超過每筆上限 max_paid_calls，超出時保留排序較前者
+        """
+        with self._lock:
+            estimates = {s: self.estimate(class_keys, s) for s in sources}
+        default_rank = {s: i for i, s in enumerate(DEFAULT_ORDER)}
+        paid_budget = self.max_expected_paid
+        if paid_budget is None:
+            paid_budget = expected_paid_calls(sorted(sources, key=lambda s: default_rank.get(s, len(DEFAULT_ORDER))), estimates)
+
+        for penalty in PAID_PENALTIES:
+            ranked = sorted(
+                sources,
+                key=lambda s: (
+                    (estimates[s][1] + (penalty if s in PAID_SOURCES else 0.0)) / max(estimates[s][0], 1e-6),
+                    default_rank.get(s, len(DEFAULT_ORDER)),
+                )
+            )
+            ordered, paid = [], 0
+            for s in ranked:
+                if s in PAID_SOURCES:
+                    if paid >= self.max_paid_calls:
+                        continue
+                    paid += 1
+                ordered.append(s)
+            if expected_paid_calls(ordered, estimates) <= paid_budget + 1e-9:
+                break
+        return ordered
+
+    def paid_calls_left(self, attempted):
+        """
+        attempted: 本筆文獻已實際查詢的來源。回傳還可以呼叫幾次付費 API (例如備援查詢)。
+        """
+        return self.max_paid_calls - sum(s in PAID_SOURCES for s in attempted)
+
+    # ========== 紀錄 ==========
+    def record_run(self, class_keys, attempts):
+        """
+        attempts: [(來源, 是否命中, 延遲秒數), ...]，依實際查詢順序。
+        """
+        with self._lock:
+            for key in [""] + list(class_keys):
+                bucket = self.stats.setdefault(key, {})
+                for source, hit, latency in attempts:
+                    entry = bucket.setdefault(source, [0, 0, 0.0])
+                    entry[0] += 1
+                    entry[1] += int(bool(hit))
+                    entry[2] += latency
+            self._pending_runs.append({
+                "ts": time.time(),
+                "class": list(class_keys),
+                "attempts": [[s, bool(h), round(l, 4)] for s, h, l in attempts],
+            })
+
+
+# ========== 離線評估 ==========
+def load_runs(runs_path=RUNS_PATH):
+    runs = []
+    with open(runs_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                runs.append(json.loads(line))
+    return runs
+
+
+def replay(order, run, estimates):
+    """
+    依指定順序重播一筆紀錄，回傳 (耗時秒數, 命中機率, 付費呼叫次數)。
+    紀錄中有實際結果的來源使用實測值；未被查詢過的來源以 estimates 的期望值代替
+    (耗時與付費次數為期望值，命中以機率累計)。
+    """
+    observed = {s: (h, l) for s, h, l in run["attempts"]}
+    cost, reach, paid = 0.0, 1.0, 0.0
+    for source in order:
+        if source in PAID_SOURCES:
+            paid += reach
+        if source in observed:
+            hit, latency = observed[source]
+            cost += reach * latency
+            if hit:
+                return cost, 1.0, paid
+        else:
+            p, c = estimates[source]
+            cost += reach * c
+            reach *= (1 - p)
+    return cost, 1.0 - reach, paid
+
+
+def evaluate_offline(runs, train_ratio=0.5, sources=None, max_paid_calls=MAX_PAID_CALLS_PER_REF):
+    """
+    依時間順序切分紀錄：前段訓練自適應排序，後段比較固定順序 (原本順序、不限付費次數)
+    與自適應順序。回傳 {"observed": ..., "estimated": ...}，兩者皆為
+    {"n", "static": (平均秒數, 命中率, 平均付費次數), "adaptive": (...)}：
+      observed  — 只用查過全部來源的紀錄，完全以實測值重播 (無模型假設，但只涵蓋
+                  命中在最後一個來源或全部未命中的文獻，樣本有偏)
+      estimated — 所有紀錄；未查詢的來源以訓練出的估計值補上，結果含模型假設，
+                  且排序本身就是在同一估計下最佳化，節省幅度會偏高
+    """
+    sources = sources or DEFAULT_ORDER
+    runs = sorted(runs, key=lambda r: r.get("ts", 0))
+    split = int(len(runs) * train_ratio)
+    train, test = runs[:split], runs[split:]
+
+    scheduler = SourceScheduler(stats_path=None, runs_path=None, max_paid_calls=max_paid_calls)
+    for run in train:
+        scheduler.record_run(run["class"], [tuple(a) for a in run["attempts"]])
+
+    totals = {mode: {"n": 0, "static": [0.0, 0.0, 0.0], "adaptive": [0.0, 0.0, 0.0]} for mode in ("observed", "estimated")}
+    for run in test:
+        estimates = {s: scheduler.estimate(run["class"], s) for s in sources}
+        orders = {"static": sources, "adaptive": scheduler.order(run["class"], sources)}
+        observed = {s for s, _, _ in run["attempts"]}
+        modes = ["estimated"] + (["observed"] if observed >= set(sources) else [])
+        for mode in modes:
+            totals[mode]["n"] += 1
+            for name, order in orders.items():
+                for i, value in enumerate(replay(order, run, estimates)):
+                    totals[mode][name][i] += value
+
+    results = {}
+    for mode, t in totals.items():
+        n = max(t["n"], 1)
+        results[mode] = {
+            "n": t["n"],
+            "static": tuple(v / n for v in t["static"]),
+            "adaptive": tuple(v / n for v in t["adaptive"]),
+        }
+    return results